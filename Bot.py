@@ -1,12 +1,25 @@
 # bot.py
-import os
+import os, io, csv, collections, socket
 import discord    
 from discord import app_commands
 from discord.ext import tasks
-from datetime import datetime, time as dtime
+from datetime import datetime, timedelta, time as dtime
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import sheets_client as sheets
+import attendance
+import availability
+import rules
+import leader
+import journal
+import memprof
+import tracing
+import fanout
+import coalesce
+import snapshot
+import profiler
 import asyncio
+from time import perf_counter
+from sheets_worker import SheetsWorker
 
 
 BOT_TOKEN  = os.environ["BOT_TOKEN"]
@@ -18,36 +31,243 @@ BERLIN = ZoneInfo("Europe/Berlin")  # du nutzt Berlin bereits
 EMBED_COLOR = discord.Color.gold()        # pick any color
 BANNER_URL  = None                        # set to an image URL if you want a header banner
 
+# Acknowledge /cant and /can as soon as they are journaled; a background task writes them to the sheet
+ACK_BEFORE_WRITE = os.getenv("ACK_BEFORE_WRITE", "0") == "1"
+# Run all sheets_client calls in a separate worker process instead of threads
+SHEETS_WORKER    = os.getenv("SHEETS_WORKER", "0") == "1"
+# Minimal intents, no message/member caches: the bot only needs slash interactions and one channel
+LEAN_PROFILE     = os.getenv("BOT_LEAN", "0") == "1"
+RSS_BUDGET_MB    = int(os.getenv("RSS_BUDGET_MB", "0"))   # 0 = no budget
+REMINDER_TEXT    = "Wake up, we raidin' today!"
+REMINDER_SENDS   = int(os.getenv("REMINDER_CONCURRENCY", "5"))  # parallel reminder sends
+IMPORT_MAX_BYTES = 512 * 1024                                    # /import_availability upload limit
+NEXT_PAGE_DAYS   = 7                                             # days per /next page
+# Opt-in: > 0 puts /cant and /can on the journaled path like ACK_BEFORE_WRITE (acknowledged at once,
+# without the names), holds them this long and writes them together, folded per (date, user)
+# (see coalesce.py). 0 = off: each command is written and confirmed from the sheet
+COALESCE_WINDOW_S = float(os.getenv("COALESCE_WINDOW_S", "0"))
+# Save the warm-start snapshot this often (and on shutdown); 0 = no snapshot at all
+SNAPSHOT_MINUTES  = float(os.getenv("SNAPSHOT_MINUTES", "10"))
+# Always-on stack sampler (cheap); /profile mode:sample then reads from it
+PROFILE_SAMPLER   = os.getenv("PROFILE_SAMPLER", "0") == "1"
+PROFILE_MAX_S     = 300                                          # longest /profile window
+# Deadlines for sheets_client calls (seconds). The call itself keeps running in its thread,
+# the caller just stops waiting. None = wait it out: serialized writes and bulk jobs.
+SHEETS_DEADLINE_S = float(os.getenv("SHEETS_DEADLINE_S", "6"))
+SHEETS_DEADLINES  = {
+    "apply_name_mutations": None,          # journal flushes must not overlap
+    "refresh_schedule_preserve_overrides": None,
+    "compact_reminders": None,
+    "get_enabled_reminders": 20.0,
+    "mark_notified_many": 20.0,
+}
+# Idempotent reads: hedged with a second request once the first is slower than
+# their recent p95 (at least SHEETS_HEDGE_MIN_MS), and served from the last good
+# result when they still fail (see _sheets_or_stale)
+HEDGED_READS   = {"get_next_raid_days", "get_schedule", "get_next7_message_id",
+                  "get_enabled_reminders", "is_today_raid_day"}
+HEDGE_MIN_S    = float(os.getenv("SHEETS_HEDGE_MIN_MS", "300")) / 1000
+# Active/standby: with a lease backend (file | sqlite | sheet) only the lease holder runs
+# the scheduled loops, writes and answers interactions; "" = single instance.
+# All instances must share BOT_DATA_DIR (rules, roster, attendance, journal; see leader.py)
+LEADER_BACKEND = os.getenv("LEADER_BACKEND", "")
+LEADER_LEASE_S = float(os.getenv("LEADER_LEASE_S", "15"))
+INSTANCE_ID    = os.getenv("INSTANCE_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaderTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # every instance receives every interaction; only the leader answers
+        return _is_leader()
+
 
 class MyClient(discord.Client):
     def __init__(self):
-        intents = discord.Intents.default()
-        super().__init__(intents=intents)
-        self.tree = app_commands.CommandTree(self)
+        if LEAN_PROFILE:
+            # interactions arrive without any intent; `guilds` keeps get_channel() working
+            intents = discord.Intents.none()
+            intents.guilds = True
+            super().__init__(
+                intents=intents,
+                max_messages=None,                                  # no message cache
+                member_cache_flags=discord.MemberCacheFlags.none(),
+                chunk_guilds_at_startup=False,
+            )
+        else:
+            intents = discord.Intents.default()
+            super().__init__(intents=intents)
+        if os.getenv("MEMTRACE", "0") == "1":
+            memprof.start()
+        if PROFILE_SAMPLER:
+            profiler.acquire_sampler()  # held for the process lifetime
+        tracing.instrument_discord(self)
+        self.tree = LeaderTree(self)
 
     async def setup_hook(self):
+        global _worker, _elector
+        if SHEETS_WORKER and _worker is None:
+            _worker = SheetsWorker()
+
+        # Mint Google tokens ahead of expiry in the background (and hand them to the worker)
+        sheets.start_token_refresh(on_refresh=_worker.push_token if _worker is not None else None)
+
+        # Serve from the last snapshot until the sheet has been re-checked
+        if SNAPSHOT_MINUTES > 0:
+            await _load_snapshot()
+
         guild = discord.Object(id=GUILD_ID)
         await self.tree.sync(guild=guild)
 
-        # Start background reminder loop AFTER the bot is ready/loop exists
-        if not reminder_loop.is_running():
-            reminder_loop.start()
-            
-        if not daily_refresh_loop.is_running():
-            daily_refresh_loop.start()
+        # Replay mutations that were acknowledged but not yet written before the last shutdown/crash
+        pending = journal.recover()
+        if pending:
+            print(f"[journal] recovered {pending} pending mutations")
+
+        if RSS_BUDGET_MB and not memory_budget_loop.is_running():
+            memory_budget_loop.start()
+
+        if SNAPSHOT_MINUTES > 0 and not snapshot_loop.is_running():
+            snapshot_loop.change_interval(minutes=SNAPSHOT_MINUTES)
+            snapshot_loop.start()
 
-        if not next7_dashboard_loop.is_running():
-            next7_dashboard_loop.start()
+        if LEADER_BACKEND:
+            if not os.getenv("BOT_DATA_DIR"):
+                raise RuntimeError("LEADER_BACKEND needs BOT_DATA_DIR on storage shared by all instances")
+            # scheduled loops start once this instance holds the lease
+            _elector = leader.Elector(leader.make_backend(LEADER_BACKEND, journal.DATA_DIR), INSTANCE_ID, LEADER_LEASE_S)
+            _elector.start(on_elected=_start_leader_duties, on_demoted=_stop_leader_duties)
+        else:
+            _start_leader_duties()
+
+    async def close(self):
+        if SNAPSHOT_MINUTES > 0:
+            await _save_snapshot()
+        if _elector is not None:
+            await _elector.stop()  # hand over to a standby right away
+        if _worker is not None:
+            await asyncio.to_thread(_worker.close)
+        await super().close()
 
-        # Update immediately at startup
-        await _refresh_next7_now()
+_elector: leader.Elector | None = None
 
-        # optional: sofort beim Start aktualisieren
-        ch = self.get_channel(CHANNEL_ID)
-        if ch:
-            await _upsert_dashboard_message(ch)
+def _is_leader() -> bool:
+    return _elector is None or _elector.is_leader
 
 client = MyClient()
+_worker: SheetsWorker | None = None
+
+_sheets_latency: dict[str, collections.deque] = {}           # fn name -> recent durations (s)
+_last_good: dict[tuple, tuple[object, datetime]] = {}          # (fn name, args) -> (result, when)
+
+async def _sheets_call(fn, args: tuple, kwargs: dict):
+    """One attempt: a thread, or the worker process with SHEETS_WORKER=1."""
+    with tracing.span(f"sheets.{fn.__name__}") as sp:
+        t_submit = perf_counter()
+        if _worker is not None:
+            result = await _worker.call(fn.__name__, *args, **kwargs)
+        else:
+            def run():
+                sp.set(queued_ms=round((perf_counter() - t_submit) * 1000, 1))
+                return profiler.call(fn, *args, **kwargs)
+            result = await asyncio.to_thread(run)
+        _sheets_latency.setdefault(fn.__name__, collections.deque(maxlen=200)).append(perf_counter() - t_submit)
+        return result
+
+def _hedge_after(name: str) -> float:
+    lat = sorted(_sheets_latency.get(name, ()))
+    if len(lat) < 20:
+        return max(HEDGE_MIN_S, 1.0)  # not enough history yet
+    return max(HEDGE_MIN_S, lat[int(len(lat) * 0.95)])
+
+async def _hedged(fn, args: tuple, kwargs: dict):
+    """First successful result of up to two identical reads; the second starts after _hedge_after()."""
+    tasks = {asyncio.ensure_future(_sheets_call(fn, args, kwargs))}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=_hedge_after(fn.__name__))
+        if not done:
+            if sp := tracing.current():
+                sp.set(hedged=True)
+            tasks.add(asyncio.ensure_future(_sheets_call(fn, args, kwargs)))
+        first_error = None
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None:
+                    return t.result()
+                first_error = first_error or t.exception()
+        raise first_error
+    finally:
+        for t in tasks:
+            t.cancel()  # the loser's thread finishes on its own; nobody waits for it
+
+async def _sheets(fn, *args, **kwargs):
+    """
+    Run a sheets_client function off the event loop, bounded by its deadline
+    (SHEETS_DEADLINES / SHEETS_DEADLINE_S); raises asyncio.TimeoutError past it.
+    """
+    name = fn.__name__
+    if name in HEDGED_READS:
+        result = await asyncio.wait_for(_hedged(fn, args, kwargs), SHEETS_DEADLINES.get(name, SHEETS_DEADLINE_S))
+        _last_good[(name, args)] = (result, datetime.now(BERLIN))
+        return result
+    return await asyncio.wait_for(_sheets_call(fn, args, kwargs), SHEETS_DEADLINES.get(name, SHEETS_DEADLINE_S))
+
+async def _sheets_or_stale(fn, *args) -> tuple[object, datetime | None]:
+    """A HEDGED_READS call -> (result, None); on deadline/error (last good result, when it was read)."""
+    try:
+        return await _sheets(fn, *args), None
+    except Exception as e:
+        hit = _last_good.get((fn.__name__, args))
+        if hit is None:
+            raise
+        print(f"[sheets] {fn.__name__} failed ({type(e).__name__}); serving result from {hit[1]:%H:%M:%S}")
+        return hit
+
+@client.tree.error
+async def _on_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(getattr(error, "original", error), asyncio.TimeoutError):
+        msg = "Google Sheets is slow right now — please try again in a minute."
+        if interaction.response.is_done():
+            await interaction.followup.send(msg, ephemeral=True)
+        else:
+            await interaction.response.send_message(msg, ephemeral=True)
+        return
+    await app_commands.CommandTree.on_error(client.tree, interaction, error)
+
+async def _apply_mutations(mutations: list[tuple[str, str, str]]) -> dict[str, tuple[str, str]]:
+    results = await _sheets(sheets.apply_name_mutations, mutations)
+    availability.apply_results(results)
+    return results
+
+# /cant and /can go through the journal (acknowledged before the write) with either option
+_JOURNALED = ACK_BEFORE_WRITE or COALESCE_WINDOW_S > 0
+_coalescer = coalesce.Coalescer(COALESCE_WINDOW_S)
+
+async def _write_now(op: str, date_str: str, user_name: str) -> tuple[str, str] | None:
+    res = (await _apply_mutations([(op, date_str, user_name)])).get(date_str)
+    _schedule_changed()
+    return res
+
+def _consume(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        print(f"[sheets] late write failed: {task.exception()}")
+
+def _note_override(op: str, date_str: str, user_name: str):
+    """/can on a date one of the user's recurring rules covers makes an exception (and /cant undoes it)."""
+    d = datetime.strptime(date_str, "%d.%m.%Y").date()
+    if rules.set_override(user_name, d, available=(op == "remove")):
+        _invalidate_next_pages()
+
+async def _mutate(op: str, date_str: str, user_name: str) -> tuple[str, str] | None:
+    """
+    One /cant (op='add') or /can (op='remove') write -> (flag, joined_names), or None if the date is unknown.
+    Raises asyncio.TimeoutError after SHEETS_DEADLINE_S; the write itself still completes.
+    """
+    _note_override(op, date_str, user_name)
+    write = asyncio.ensure_future(_write_now(op, date_str, user_name))
+    write.add_done_callback(_consume)
+    return await asyncio.wait_for(asyncio.shield(write), SHEETS_DEADLINE_S)
 
 def normalize_date(user_input: str) -> str:
     """
@@ -88,6 +308,10 @@ def normalize_date(user_input: str) -> str:
 def _in_right_channel(interaction: discord.Interaction) -> bool:
     return interaction.channel_id == CHANNEL_ID
 
+def _is_admin(interaction: discord.Interaction) -> bool:
+    # resolved permissions come with the interaction payload, no member cache needed
+    return bool(interaction.permissions and interaction.permissions.manage_guild)
+
 def _valid_date(date_str: str) -> bool:
     try:
         datetime.strptime(date_str, "%d.%m.%Y")
@@ -95,6 +319,63 @@ def _valid_date(date_str: str) -> bool:
     except ValueError:
         return False
 
+async def _ack_mutation(interaction: discord.Interaction, op: str, date: str):
+    """Journaled path for /cant (op='add') and /can (op='remove'): journal, confirm, return."""
+    try:
+        norm = normalize_date(date)
+    except ValueError as e:
+        await interaction.response.send_message(f"Invalid date: {e}. Examples: 7.9  or  07.09.2025", ephemeral=True)
+        return
+    if op == "remove" and datetime.strptime(norm, "%d.%m.%Y").weekday() not in PLANNED_DAYS:
+        await interaction.response.send_message(
+            "That date is **not a planned raid day** (Mon/Wed/Thu) – it stays **✖**.",
+            ephemeral=True
+        )
+        return
+    if not sheets.in_window(norm):
+        await interaction.response.send_message("Date not found in the current 3-month range.", ephemeral=True)
+        return
+
+    user_name = interaction.user.display_name or interaction.user.name
+    _note_override(op, norm, user_name)
+    journal.append(op, norm, user_name)
+    if op == "add":
+        await interaction.response.send_message(f"Saved: **{norm}** → ✖  (syncing to the sheet)", ephemeral=True)
+    else:
+        await interaction.response.send_message(f"Updated: **{norm}** → your ✖ is removed  (syncing to the sheet)", ephemeral=True)
+
+async def _apply_journal(force: bool = False):
+    """Write the pending journal entries, folded, once the oldest has waited out COALESCE_WINDOW_S."""
+    entries = journal.pending()
+    if not entries or not (force or _coalescer.due(entries)):
+        return
+    mutations = _coalescer.fold(entries)
+    try:
+        with tracing.span("loop.journal_apply", root=True, entries=len(entries), writes=len(mutations)):
+            results = await _apply_mutations(mutations)  # keeps the availability bitsets in step
+    except Exception as e:
+        print(f"[journal] apply failed, retrying next tick: {e}")
+        return
+    journal.truncate(entries[-1]["seq"])
+    for op, date_str, user in mutations:
+        if date_str not in results:
+            # acknowledged from in_window(), but the sheet has no row for it (e.g. a new month
+            # before the daily refresh added it): say so instead of losing it quietly
+            print(f"[journal] DROPPED {op} {date_str} for {user}: date not on the sheet")
+    _coalescer.flushed(len(entries), len(mutations))
+    print(f"[journal] applied {len(entries)} mutations ({len(mutations)} after folding) across {len(results)} dates")
+    _schedule_changed()  # one dashboard refresh per flush
+
+@tasks.loop(seconds=1)
+async def journal_apply_loop():
+    if not _is_leader():
+        return  # lease lapsed; the demotion cancels this loop shortly
+    await _apply_journal()
+
+@journal_apply_loop.before_loop
+async def _wait_journal_ready():
+    await client.wait_until_ready()
+
 # /cant — add name, force ✖
 @client.tree.command(
     name="cant",
@@ -102,26 +383,34 @@ def _valid_date(date_str: str) -> bool:
     guild=discord.Object(id=GUILD_ID)
 )
 @app_commands.describe(date="Date like 7.9 or 7.9.2025 (year optional)")
+@tracing.traced("/cant")
 async def cant(interaction: discord.Interaction, date: str):
     if interaction.channel_id != CHANNEL_ID:
         await interaction.response.send_message("Only in schedule-commands please :/", ephemeral=True)
         return
+    if _JOURNALED:
+        await _ack_mutation(interaction, "add", date)
+        return
     await interaction.response.defer(ephemeral=True, thinking=True)
 
     try:
-        norm = normalize_date(date)
+        with tracing.span("normalize_date"):
+            norm = normalize_date(date)
     except ValueError as e:
         await interaction.followup.send(f"Invalid date: {e}. Examples: 7.9  or  07.09.2025")
         return
 
     # prefer server display name
     user_name = interaction.user.display_name or interaction.user.name
-    found, names = await asyncio.to_thread(sheets.add_cant_user, norm, user_name)
-    if found:
-        await interaction.followup.send(f"Saved: **{norm}** → ✖  (can't: {names})")
-    else:
+    try:
+        res = await _mutate("add", norm, user_name)
+    except asyncio.TimeoutError:
+        await interaction.followup.send(f"Google Sheets is slow right now — **{norm}** → ✖ is queued and will be saved shortly.")
+        return
+    if res is None:
         await interaction.followup.send("Date not found in the current 3-month range.")
-    asyncio.create_task(_refresh_next7_now())
+    else:
+        await interaction.followup.send(f"Saved: **{norm}** → ✖  (can't: {res[1]})")
 
 # /can — remove name; if none left → ✔, else keep ✖
 @client.tree.command(
@@ -130,14 +419,19 @@ async def cant(interaction: discord.Interaction, date: str):
     guild=discord.Object(id=GUILD_ID)
 )
 @app_commands.describe(date="Date like 7.9 or 7.9.2025 (year optional)")
+@tracing.traced("/can")
 async def can_cmd(interaction: discord.Interaction, date: str):
     if interaction.channel_id != CHANNEL_ID:
         await interaction.response.send_message("Only in schedule-commands please :/", ephemeral=True)
         return
+    if _JOURNALED:
+        await _ack_mutation(interaction, "remove", date)
+        return
     await interaction.response.defer(ephemeral=True, thinking=True)
 
     try:
-        norm = normalize_date(date)
+        with tracing.span("normalize_date"):
+            norm = normalize_date(date)
     except ValueError as e:
         await interaction.followup.send(f"Invalid date: {e}. Examples: 7.9  or  07.09.2025")
         return
@@ -152,18 +446,23 @@ async def can_cmd(interaction: discord.Interaction, date: str):
         return
 
     user_name = interaction.user.display_name or interaction.user.name
-    found, new_flag, names = await asyncio.to_thread(sheets.remove_cant_user, norm, user_name)
-    if found:
-        if names:
-            await interaction.followup.send(f"Updated: **{norm}** → {new_flag}  (can't: {names})")
-        else:
-            await interaction.followup.send(f"Updated: **{norm}** → ✔  (nobody marked as can't)")
-    else:
+    try:
+        res = await _mutate("remove", norm, user_name)
+    except asyncio.TimeoutError:
+        await interaction.followup.send(f"Google Sheets is slow right now — removing your ✖ on **{norm}** is queued and will be saved shortly.")
+        return
+    if res is None:
         await interaction.followup.send("Date not found in the current 3-month range.")
-    asyncio.create_task(_refresh_next7_now())
+        return
+    new_flag, names = res
+    if names:
+        await interaction.followup.send(f"Updated: **{norm}** → {new_flag}  (can't: {names})")
+    else:
+        await interaction.followup.send(f"Updated: **{norm}** → ✔  (nobody marked as can't)")
 
 @client.tree.command(name="refresh", description="Refresh sheet (preserves ✔/✖ overrides).",
                      guild=discord.Object(id=GUILD_ID))
+@tracing.traced("/refresh")
 async def refresh_cmd(interaction: discord.Interaction):
     # optional: restrict to your bot channel
     if interaction.channel_id != CHANNEL_ID:
@@ -172,19 +471,140 @@ async def refresh_cmd(interaction: discord.Interaction):
 
     await interaction.response.defer(ephemeral=True, thinking=True)
     try:
-        sheets.refresh_schedule_preserve_overrides()
+        rules.record_written(await _sheets(sheets.refresh_schedule_preserve_overrides))
+        _schedule_changed()
         await interaction.followup.send("✅ Schedule refreshed (overrides preserved).", ephemeral=True)
     except Exception as e:
         await interaction.followup.send(f"❌ Refresh failed: `{e}`", ephemeral=True)
 
+def _iter_availability_csv(data: bytes):
+    """
+    Stream-parse an availability CSV. Rows: `user,date` or `user,from,to`
+    (`user,from..to` works too); ',' or ';' separated, optional header line.
+    UTF-8, or Windows-1252 as Excel exports it. Raises csv.Error on malformed input.
+    Yields (line_no, raw_row, dates | None, user_or_reason).
+    """
+    try:
+        decoded = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        decoded = data.decode("cp1252", errors="replace")
+    text = io.StringIO(decoded, newline="")
+    first = text.readline()
+    delim = ";" if first.count(";") > first.count(",") else ","
+
+    def lines():
+        yield first
+        yield from text
+
+    for line_no, row in enumerate(csv.reader(lines(), delimiter=delim), start=1):
+        row = [c.strip() for c in row]
+        if not any(row):
+            continue
+        raw = delim.join(row)
+        if len(row) == 2 and ".." in row[1]:
+            row = [row[0], *row[1].split("..", 1)]
+        if len(row) not in (2, 3) or not row[0]:
+            yield line_no, raw, None, "expected user,date or user,from,to"
+            continue
+        try:
+            start = datetime.strptime(normalize_date(row[1]), "%d.%m.%Y")
+            end = datetime.strptime(normalize_date(row[2]), "%d.%m.%Y") if len(row) == 3 and row[2] else start
+        except ValueError as e:
+            if line_no == 1 and not any(ch.isdigit() for ch in raw):
+                continue  # header line
+            yield line_no, raw, None, f"invalid date: {e}"
+            continue
+        if end < start:
+            yield line_no, raw, None, "range ends before it starts"
+            continue
+        if (end - start).days > 200:
+            yield line_no, raw, None, "range longer than 200 days"
+            continue
+        dates = []
+        d = start
+        while d <= end:
+            ds = d.strftime("%d.%m.%Y")
+            if sheets.in_window(ds):
+                dates.append(ds)
+            d += timedelta(days=1)
+        if not dates:
+            yield line_no, raw, None, "outside the current 3-month range"
+            continue
+        yield line_no, raw, dates, row[0]
+
+@client.tree.command(
+    name="import_availability",
+    description="(Admin) Import can't dates from a CSV (user,date or user,from,to).",
+    guild=discord.Object(id=GUILD_ID)
+)
+@app_commands.describe(file="CSV with rows: user,date  or  user,from,to")
+@tracing.traced("/import_availability")
+async def import_availability_cmd(interaction: discord.Interaction, file: discord.Attachment):
+    if interaction.channel_id != CHANNEL_ID:
+        await interaction.response.send_message("Only in schedule-commands please :/", ephemeral=True)
+        return
+    if not _is_admin(interaction):
+        await interaction.response.send_message("Admins only.", ephemeral=True)
+        return
+    if file.size > IMPORT_MAX_BYTES:
+        await interaction.response.send_message(f"File too large (max {IMPORT_MAX_BYTES // 1024} KB).", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+
+    data = await file.read()
+    mutations: list[tuple[str, str, str]] = []
+    sources: list[tuple[int, str, list[str]]] = []
+    rejected: list[tuple[int, str, str]] = []
+    with tracing.span("import.parse"):
+        try:
+            for line_no, raw, dates, user_or_reason in _iter_availability_csv(data):
+                if dates is None:
+                    rejected.append((line_no, raw, user_or_reason))
+                    continue
+                mutations.extend(("add", d, user_or_reason) for d in dates)
+                sources.append((line_no, raw, dates))
+        except csv.Error as e:
+            await interaction.followup.send(f"❌ Could not read the CSV: `{e}`", ephemeral=True)
+            return
+
+    results: dict = {}
+    if mutations:
+        try:
+            results = await _apply_mutations(mutations)                     # one batched write
+        except Exception as e:
+            await interaction.followup.send(f"❌ Import failed: `{e}`", ephemeral=True)
+            return
+        _schedule_changed()                                                 # one dashboard update
+    for line_no, raw, dates in sources:
+        if not any(d in results for d in dates):
+            rejected.append((line_no, raw, "date not found in the sheet"))
+
+    applied = [m for m in mutations if m[1] in results]
+    users = {m[2].lower() for m in applied}
+    msg = (f"✅ Imported **{len(applied)}** can't entries for **{len(users)}** users "
+           f"across **{len({m[1] for m in applied})}** dates. Rejected rows: **{len(rejected)}**.")
+    if not rejected:
+        await interaction.followup.send(msg, ephemeral=True)
+        return
+    out = io.StringIO()
+    w = csv.writer(out)
+    w.writerow(["line", "row", "reason"])
+    for row in sorted(rejected):
+        w.writerow(row)
+    await interaction.followup.send(
+        msg, file=discord.File(io.BytesIO(out.getvalue().encode("utf-8")), filename="rejected_rows.csv"),
+        ephemeral=True
+    )
+
 # /remind on [time]
 @client.tree.command(
     name="remind_on",
     description="Enable raid reminder. Optional time HH:MM (Selected timezone otherwise server time).",
     guild=discord.Object(id=GUILD_ID)
 )
-@app_commands.describe(time="HH:MM (24h). Default 17:00")
-async def remind_on(interaction: discord.Interaction, time: str | None = None):
+@app_commands.describe(time="HH:MM (24h). Default 17:00", dm="Send the reminder as a DM instead of a channel ping")
+@tracing.traced("/remind_on")
+async def remind_on(interaction: discord.Interaction, time: str | None = None, dm: bool | None = None):
     if interaction.channel_id != CHANNEL_ID:
         await interaction.response.send_message("Only in schedule-commands please :/", ephemeral=True)
         return
@@ -199,14 +619,16 @@ async def remind_on(interaction: discord.Interaction, time: str | None = None):
         await interaction.followup.send("Time must be HH:MM (24-hour), e.g. 17:00", ephemeral=True)
         return
 
-    await asyncio.to_thread(
+    await _sheets(
         sheets.set_reminder,
         interaction.user.id,
         f"{interaction.user.name}#{interaction.user.discriminator}" if hasattr(interaction.user,"discriminator") else interaction.user.name,
         True,
-        hhmm
+        hhmm,
+        dm
     )
-    await interaction.followup.send(f"✅ Reminders enabled at **{hhmm}** on raid days.", ephemeral=True)
+    where = " via DM" if dm else ""
+    await interaction.followup.send(f"✅ Reminders enabled at **{hhmm}**{where} on raid days.", ephemeral=True)
 
 # /remind off
 @client.tree.command(
@@ -214,13 +636,14 @@ async def remind_on(interaction: discord.Interaction, time: str | None = None):
     description="Disable raid reminders.",
     guild=discord.Object(id=GUILD_ID)
 )
+@tracing.traced("/remind_off")
 async def remind_off(interaction: discord.Interaction):
     if interaction.channel_id != CHANNEL_ID:
         await interaction.response.send_message("Only in schedule-commands please :/", ephemeral=True)
         return
     await interaction.response.defer(ephemeral=True, thinking=True)
 
-    await asyncio.to_thread(
+    await _sheets(
         sheets.set_reminder,
         interaction.user.id,
         f"{interaction.user.name}#{interaction.user.discriminator}" if hasattr(interaction.user,"discriminator") else interaction.user.name,
@@ -239,11 +662,16 @@ def _now_hhmm_date_in_tz(tz: str):
 SCHEDULE_TZ = "Europe/Berlin"
 
 @tasks.loop(time=dtime(hour=4, minute=0, tzinfo=ZoneInfo(SCHEDULE_TZ)))
+@tracing.traced("loop.daily_refresh")
 async def daily_refresh_loop():
+    if not _is_leader():
+        return
     try:
         print(f"[daily_refresh] running at {datetime.now(ZoneInfo(SCHEDULE_TZ)).strftime('%Y-%m-%d %H:%M:%S %Z')}")
-        await asyncio.to_thread(sheets.refresh_schedule_preserve_overrides)
-        print("[daily_refresh] refresh completed")
+        rules.record_written(await _sheets(sheets.refresh_schedule_preserve_overrides))
+        _invalidate_next_pages()
+        removed = await _sheets(sheets.compact_reminders)
+        print(f"[daily_refresh] refresh completed ({removed} stale reminder rows compacted)")
     except Exception as e:
         print(f"[daily_refresh] error: {e}")
 
@@ -258,13 +686,18 @@ async def _wait_daily_refresh_ready():
     await client.wait_until_ready()
 
 @tasks.loop(minutes=1)
+@tracing.traced("loop.reminder")
 async def reminder_loop():
+    if not _is_leader():
+        return
     try:
-        # Gate by global schedule (Berlin-based ✔ day)
-        if not await asyncio.to_thread(sheets.is_today_raid_day):
+        # Gate by global schedule (Berlin-based ✔ day); the date is part of the stale-fallback
+        # key, so a brownout never serves yesterday's answer for today
+        raid_today, _stale = await _sheets_or_stale(sheets.is_today_raid_day, datetime.now(BERLIN).date())
+        if not raid_today:
             return
 
-        reminders = await asyncio.to_thread(sheets.get_enabled_reminders)
+        reminders, _stale = await _sheets_or_stale(sheets.get_enabled_reminders)
         if not reminders:
             return
 
@@ -282,24 +715,53 @@ async def reminder_loop():
             if r["time"] == now_hhmm_local and r.get("last", "") != today_iso_local:
                 to_ping.append({**r, "today_iso_local": today_iso_local})
 
-        if not to_ping:
-            return
-
-        # Send a single message that mentions all users whose local reminder fired
-        channel = client.get_channel(CHANNEL_ID)
-        if channel is None:
-            return
+        if not to_ping or not _is_leader():
+            return  # the lease may have lapsed during the reads above
 
-        mentions = " ".join(f"<@{r['user_id']}>" for r in to_ping)
-        await channel.send(f"Wake up, we raidin' today! {mentions}")
+        delivered = await _deliver_reminders(to_ping)
 
-        # Mark each user as notified using their local date (so we don't re-ping at 00:xx boundaries)
-        for r in to_ping:
-            await asyncio.to_thread(sheets.mark_notified, r["user_id"], r["today_iso_local"])
+        # Mark only delivered users, using their local date (so we don't re-ping at 00:xx boundaries)
+        if delivered:
+            await _sheets(sheets.mark_notified_many, [(r["user_id"], r["today_iso_local"]) for r in delivered])
 
     except Exception as e:
         print(f"[reminder_loop] error: {e}")
 
+_reminder_sender: fanout.RateLimitedSender | None = None
+
+async def _deliver_reminders(to_ping: list[dict]) -> list[dict]:
+    """
+    DM users who asked for it, mention everyone else in size-safe channel messages.
+    A failed DM falls back to the channel. Returns the reminders that were delivered.
+    """
+    global _reminder_sender
+    if _reminder_sender is None:
+        _reminder_sender = fanout.RateLimitedSender(REMINDER_SENDS)
+    by_id = {r["user_id"]: r for r in to_ping}
+    delivered: list[int] = []
+
+    async def dm(uid: int):
+        async def call():
+            ch = await client.create_dm(discord.Object(id=uid))
+            await ch.send(REMINDER_TEXT)
+        if await _reminder_sender.run(call):
+            delivered.append(uid)
+            return None
+        return uid  # fall back to a channel mention
+
+    dm_ids = [uid for uid, r in by_id.items() if r.get("dm")]
+    fallback = await asyncio.gather(*(dm(uid) for uid in dm_ids))
+    channel_ids = [uid for uid, r in by_id.items() if not r.get("dm")] + [uid for uid in fallback if uid]
+
+    channel = client.get_channel(CHANNEL_ID)
+    if channel_ids and channel is not None:
+        async def post(text: str, ids: list[int]):
+            if await _reminder_sender.run(lambda: channel.send(text)):
+                delivered.extend(ids)
+        await asyncio.gather(*(post(text, ids) for text, ids in fanout.chunk_mentions(REMINDER_TEXT, channel_ids)))
+
+    return [by_id[uid] for uid in delivered]
+
 @reminder_loop.before_loop
 async def _wait_until_ready():
     await client.wait_until_ready()
@@ -310,6 +772,7 @@ async def _wait_until_ready():
     guild=discord.Object(id=GUILD_ID)
 )
 @app_commands.describe(tz="Your timezone. Example: Europe/Berlin, Europe/London")
+@tracing.traced("/set_timezone")
 async def set_timezone_cmd(interaction: discord.Interaction, tz: str):
     if interaction.channel_id != CHANNEL_ID:
         await interaction.response.send_message("Only in schedule-commands please :/", ephemeral=True)
@@ -326,9 +789,209 @@ async def set_timezone_cmd(interaction: discord.Interaction, tz: str):
         )
         return
 
-    await asyncio.to_thread(sheets.set_timezone, interaction.user.id, tz)
+    await _sheets(sheets.set_timezone, interaction.user.id, tz)
     await interaction.followup.send(f"✅ Timezone saved: **{tz}**", ephemeral=True)
 
+# /attendance — answers from the precomputed archive aggregates, no Sheets calls
+@client.tree.command(
+    name="attendance",
+    description="Show archived raid attendance (yours or someone else's).",
+    guild=discord.Object(id=GUILD_ID)
+)
+@app_commands.describe(name="Name as it appears in the sheet (default: you)")
+@tracing.traced("/attendance")
+async def attendance_cmd(interaction: discord.Interaction, name: str | None = None):
+    if interaction.channel_id != CHANNEL_ID:
+        await interaction.response.send_message("Only in schedule-commands please :/", ephemeral=True)
+        return
+
+    who = (name or interaction.user.display_name or interaction.user.name).strip()
+    lines = [f"📊 **Attendance for {who}**", f"Can't (all time): **{attendance.user_cant_count(who)}**"]
+    for weeks in (4, 12):
+        res = attendance.rolling_attendance(who, weeks)
+        if res is None:
+            lines.append(f"Last {weeks} weeks: _no archived raid days_")
+        else:
+            attended, planned = res
+            lines.append(f"Last {weeks} weeks: **{attended}/{planned}** planned raids ({attended * 100 // planned}%)")
+
+    rates = []
+    for wd, (cancelled, planned) in sorted(attendance.weekday_cancellation_rates().items()):
+        if planned:
+            rates.append(f"{sheets._WD_NAMES[wd][:3]} {cancelled * 100 // planned}%")
+    if rates:
+        lines.append("Cancelled raids by weekday: " + " • ".join(rates))
+
+    await interaction.response.send_message("\n".join(lines), ephemeral=True)
+
+# /bestdays — rank upcoming dates by how many of the core roster can come (bitset popcounts, no Sheets calls)
+@client.tree.command(
+    name="bestdays",
+    description="Upcoming days ranked by how many core roster players can come.",
+    guild=discord.Object(id=GUILD_ID)
+)
+@app_commands.describe(min_players="Only days where at least this many roster players can come")
+@tracing.traced("/bestdays")
+async def bestdays_cmd(interaction: discord.Interaction, min_players: int = 0):
+    if interaction.channel_id != CHANNEL_ID:
+        await interaction.response.send_message("Only in schedule-commands please :/", ephemeral=True)
+        return
+    size = len(availability.roster())
+    if not size:
+        await interaction.response.send_message(
+            "The roster is empty — an admin can add core players with `/roster add`.", ephemeral=True
+        )
+        return
+
+    stale = None
+    if availability.loaded():
+        send = interaction.response.send_message
+    else:
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        days, stale = await _sheets_or_stale(sheets.get_schedule)
+        availability.load_days(days)
+        send = interaction.followup.send
+
+    t0 = perf_counter()
+    top = availability.best_days(max(0, min_players), limit=10)
+    took_us = (perf_counter() - t0) * 1e6
+
+    if not top:
+        lines = [f"No upcoming day has **{min_players}/{size}** roster players available."]
+    else:
+        lines = [f"🏆 **Best days** (roster of {size}" + (f", at least {min_players}" if min_players else "") + ")"]
+        for d in top:
+            line = f"{d['flag']} **{d['date']}** ({d['weekday']}) — **{d['available']}/{size}**"
+            if d["missing"]:
+                line += f" · missing: {', '.join(d['missing'])}"
+            lines.append(line)
+    footer = f"ranked in {took_us:.0f}µs"
+    if stale:
+        footer += f" • ⚠ Sheets unreachable, data from {stale:%H:%M}"
+    lines.append(f"-# {footer}")
+    await send("\n".join(lines)[:2000], ephemeral=True)
+
+roster_group = app_commands.Group(name="roster", description="Core roster used by /bestdays.",
+                                  guild_ids=[GUILD_ID])
+
+@roster_group.command(name="show", description="List the core roster.")
+@tracing.traced("/roster show")
+async def roster_show(interaction: discord.Interaction):
+    names = availability.roster()
+    text = ", ".join(names) if names else "_empty_"
+    await interaction.response.send_message(f"👥 **Roster ({len(names)})**: {text}"[:2000], ephemeral=True)
+
+@roster_group.command(name="add", description="(Admin) Add a core player (name as it appears in the sheet).")
+@app_commands.describe(name="Name as it appears in the sheet")
+@tracing.traced("/roster add")
+async def roster_add(interaction: discord.Interaction, name: str):
+    if not _is_admin(interaction):
+        await interaction.response.send_message("Admins only.", ephemeral=True)
+        return
+    if availability.add_member(name):
+        await interaction.response.send_message(f"Added **{name.strip()}** to the roster.", ephemeral=True)
+    else:
+        await interaction.response.send_message(f"**{name.strip()}** is already on the roster.", ephemeral=True)
+
+@roster_group.command(name="remove", description="(Admin) Remove a core player.")
+@app_commands.describe(name="Name as it appears in the sheet")
+@tracing.traced("/roster remove")
+async def roster_remove(interaction: discord.Interaction, name: str):
+    if not _is_admin(interaction):
+        await interaction.response.send_message("Admins only.", ephemeral=True)
+        return
+    if availability.remove_member(name):
+        await interaction.response.send_message(f"Removed **{name.strip()}** from the roster.", ephemeral=True)
+    else:
+        await interaction.response.send_message(f"**{name.strip()}** is not on the roster.", ephemeral=True)
+
+client.tree.add_command(roster_group)
+
+# /rules — recurring "can't" (weekday / every N weeks / date span), evaluated lazily,
+# written into the sheet only by the daily refresh
+rules_group = app_commands.Group(name="rules", description="Your recurring can't rules.",
+                                 guild_ids=[GUILD_ID])
+_WEEKDAY_CHOICES = [app_commands.Choice(name=n, value=i) for i, n in enumerate(sheets._WD_NAMES)]
+
+def _rule_date(value: str | None):
+    return datetime.strptime(normalize_date(value), "%d.%m.%Y").date() if value else None
+
+async def _add_rule(interaction: discord.Interaction, **kw):
+    if interaction.channel_id != CHANNEL_ID:
+        await interaction.response.send_message("Only in schedule-commands please :/", ephemeral=True)
+        return
+    user_name = interaction.user.display_name or interaction.user.name
+    try:
+        for k in ("start", "end"):
+            kw[k] = _rule_date(kw.get(k))
+        rule = rules.add_rule(user_name, **kw)
+    except ValueError as e:
+        await interaction.response.send_message(f"Invalid rule: {e}", ephemeral=True)
+        return
+    _schedule_changed()
+    await interaction.response.send_message(
+        f"Saved rule #{rule['id']}: can't **{rules.describe(rule)}**. "
+        f"It shows up right away and is written to the sheet with the daily refresh.",
+        ephemeral=True
+    )
+
+@rules_group.command(name="weekly", description="Can't on a weekday, every week or every N weeks.")
+@app_commands.describe(weekday="Weekday you can't make", every_weeks="1 = every week, 2 = every other week, ...",
+                       start="First date (e.g. 7.9), default today", until="Last date (optional)")
+@app_commands.choices(weekday=_WEEKDAY_CHOICES)
+@tracing.traced("/rules weekly")
+async def rules_weekly(interaction: discord.Interaction, weekday: int, every_weeks: int = 1,
+                       start: str | None = None, until: str | None = None):
+    await _add_rule(interaction, weekday=weekday, every_weeks=max(1, every_weeks), start=start, end=until)
+
+@rules_group.command(name="away", description="Can't on every day of a date span (vacation).")
+@app_commands.describe(start="First day away (e.g. 7.9)", until="Last day away (e.g. 21.9)")
+@tracing.traced("/rules away")
+async def rules_away(interaction: discord.Interaction, start: str, until: str):
+    await _add_rule(interaction, start=start, end=until)
+
+@rules_group.command(name="list", description="Show your recurring can't rules.")
+@tracing.traced("/rules list")
+async def rules_list(interaction: discord.Interaction):
+    if interaction.channel_id != CHANNEL_ID:
+        await interaction.response.send_message("Only in schedule-commands please :/", ephemeral=True)
+        return
+    user_name = interaction.user.display_name or interaction.user.name
+    mine = rules.rules_for(user_name)
+    if not mine:
+        await interaction.response.send_message("You have no rules. Add one with `/rules weekly` or `/rules away`.",
+                                                ephemeral=True)
+        return
+    lines = [f"#{r['id']}: can't {rules.describe(r)}" for r in mine]
+    await interaction.response.send_message("\n".join(lines)[:2000], ephemeral=True)
+
+@rules_group.command(name="remove", description="Delete one of your rules.")
+@app_commands.describe(rule_id="Number from /rules list")
+@tracing.traced("/rules remove")
+async def rules_remove(interaction: discord.Interaction, rule_id: int):
+    if interaction.channel_id != CHANNEL_ID:
+        await interaction.response.send_message("Only in schedule-commands please :/", ephemeral=True)
+        return
+    user_name = interaction.user.display_name or interaction.user.name
+    rule = next((r for r in rules.rules_for(user_name) if r["id"] == rule_id), None)
+    if rule is None:
+        await interaction.response.send_message(f"You have no rule #{rule_id}.", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    rules.remove_rule(user_name, rule_id)
+    # take out only the names the daily refresh wrote for this rule (not /cant entries), in one batch;
+    # off days stay ✖ whatever the names say
+    written = rules.written_dates(rule, rules.rules_for(user_name))
+    if written:
+        await _apply_mutations([
+            ("remove" if datetime.strptime(d, "%d.%m.%Y").weekday() in PLANNED_DAYS else "unlist", d, user_name)
+            for d in written
+        ])
+    _schedule_changed()
+    await interaction.followup.send(f"Removed rule #{rule_id} (can't {rules.describe(rule)}).", ephemeral=True)
+
+client.tree.add_command(rules_group)
+
 
 def _format_next7(days: list[dict]) -> str:
     if not days:
@@ -341,30 +1004,37 @@ def _format_next7(days: list[dict]) -> str:
 
     return "📅 **Next 7 Raid Days** 📅\n" + "\n".join(lines)
 
-async def _upsert_dashboard_message(channel: discord.TextChannel):
+async def _upsert_dashboard_message(channel: discord.TextChannel) -> datetime | None:
+    """Post or edit the dashboard; returns when its data was read if Sheets was unreachable (stale), else None."""
     try:
-        days = await asyncio.to_thread(sheets.get_next_raid_days, 7)
-        embed = _build_next7_embed(days)
+        days, stale = await _sheets_or_stale(sheets.get_next_raid_days, 7)
+        if _next_pages_gen != _next_pages_at and stale is None:
+            await _get_next_pages(False)  # re-render /next while the block cache is warm
+        embed = _build_next7_embed(days, stale)
 
-        msg_id = await asyncio.to_thread(sheets.get_next7_message_id)
+        msg_id, _ = await _sheets_or_stale(sheets.get_next7_message_id)
         if msg_id:
             try:
                 msg = await channel.fetch_message(msg_id)
                 await msg.edit(content=None, embed=embed)   # edit the existing embed
                 print(f"[next7] edited message {msg.id}")
-                return
+                return stale
             except discord.NotFound:
                 print(f"[next7] stored message {msg_id} not found; creating new")
 
         sent = await channel.send(embed=embed)              # send a new embed
-        await asyncio.to_thread(sheets.set_next7_message_id, sent.id)
+        await _sheets(sheets.set_next7_message_id, sent.id)
         print(f"[next7] posted new message {sent.id}")
+        return stale
     except Exception as e:
         print(f"[next7] error: {e}")
         raise
 
 @tasks.loop(time=dtime(hour=4, minute=5, tzinfo=BERLIN))
+@tracing.traced("loop.next7_dashboard")
 async def next7_dashboard_loop():
+    if not _is_leader():
+        return
     channel = client.get_channel(CHANNEL_ID)
     if channel:
         await _upsert_dashboard_message(channel)
@@ -378,35 +1048,334 @@ async def _wait_next7_ready():
     description="Post/Update the 'Next 7 Raid Days' dashboard now.",
     guild=discord.Object(id=GUILD_ID)
 )
+@tracing.traced("/next7")
 async def next7_cmd(interaction: discord.Interaction):
     if interaction.channel_id != CHANNEL_ID:
         await interaction.response.send_message("Only in the schedule channel please :/", ephemeral=True)
         return
     await interaction.response.defer(ephemeral=True, thinking=True)
     try:
-        await _upsert_dashboard_message(interaction.channel)
-        await interaction.followup.send("✅ Dashboard updated.", ephemeral=True)
+        stale = await _upsert_dashboard_message(interaction.channel)
+        if stale:
+            await interaction.followup.send(
+                f"⚠️ Google Sheets is slow; dashboard shows data from {stale:%H:%M}.", ephemeral=True
+            )
+        else:
+            await interaction.followup.send("✅ Dashboard updated.", ephemeral=True)
     except Exception as e:
         await interaction.followup.send(f"❌ Failed: `{e}`", ephemeral=True)
         print(f"[next7_cmd] error: {e}")
 
-async def _refresh_next7_now():
-    ch = client.get_channel(CHANNEL_ID)
-    if ch is None:
+@client.tree.command(
+    name="memory",
+    description="(Admin) Show RSS and top allocating modules.",
+    guild=discord.Object(id=GUILD_ID)
+)
+@app_commands.describe(top="How many modules to list (default 10)", stop="Turn tracemalloc off afterwards")
+@tracing.traced("/memory")
+async def memory_cmd(interaction: discord.Interaction, top: int = 10, stop: bool = False):
+    if not _is_admin(interaction):
+        await interaction.response.send_message("Admins only.", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    started = not memprof.tracemalloc.is_tracing()
+    memprof.start()
+    text = await asyncio.to_thread(memprof.report, max(1, min(top, 25)), RSS_BUDGET_MB)
+    if started:
+        text += "\n(tracemalloc just started — run again later for allocations since now)"
+    if stop:
+        memprof.stop()
+    await interaction.followup.send(f"```\n{text[:1900]}\n```", ephemeral=True)
+
+@client.tree.command(
+    name="traces",
+    description="(Admin) Show the slowest recent interaction/loop traces.",
+    guild=discord.Object(id=GUILD_ID)
+)
+@app_commands.describe(count="How many traces (default 3)")
+async def traces_cmd(interaction: discord.Interaction, count: int = 3):
+    if not _is_admin(interaction):
+        await interaction.response.send_message("Admins only.", ephemeral=True)
+        return
+    roots = tracing.slowest(max(1, min(count, 10)))
+    if not roots:
+        await interaction.response.send_message("No traces recorded yet.", ephemeral=True)
+        return
+    lines = []
+    tok = sheets.token_stats()  # token refreshes happen off the request path; show that they keep up
+    if tok:
+        lines += [f"token: {tok['refreshes']} refreshes, p50 {tok['p50_ms']:.0f}ms, max {tok['max_ms']:.0f}ms, "
+                  f"valid for {tok['seconds_left']}s", ""]
+    for root in roots:
+        lines.extend(tracing.format_tree(root))
+        lines.append("")
+    text = "\n".join(lines)
+    if len(text) <= 1900:
+        await interaction.response.send_message(f"```\n{text}\n```", ephemeral=True)
+    else:
+        await interaction.response.send_message(
+            file=discord.File(io.BytesIO(text.encode("utf-8")), filename="traces.txt"), ephemeral=True
+        )
+
+@client.tree.command(
+    name="profile",
+    description="(Admin) Profile the bot for a few seconds and upload the top functions.",
+    guild=discord.Object(id=GUILD_ID)
+)
+@app_commands.describe(
+    seconds=f"Window length (1-{PROFILE_MAX_S})",
+    mode="cprofile = deterministic (loop + Sheets threads), sample = low-overhead stack sampling"
+)
+@app_commands.choices(mode=[
+    app_commands.Choice(name="cprofile", value="cprofile"),
+    app_commands.Choice(name="sample", value="sample"),
+])
+# not traced: the window would make every run the slowest trace and push real ones out of /traces
+async def profile_cmd(interaction: discord.Interaction, seconds: int = 10, mode: str = "cprofile"):
+    if not _is_admin(interaction):
+        await interaction.response.send_message("Admins only.", ephemeral=True)
+        return
+    seconds = max(1, min(seconds, PROFILE_MAX_S))
+    # claim the profiler before the first await, so an overlapping /profile is refused up front
+    if mode == "sample":
+        smp = profiler.acquire_sampler()
+    else:
         try:
-            ch = await client.fetch_channel(CHANNEL_ID)
-        except Exception as e:
-            print(f"[next7] fetch_channel failed: {e}")
+            profiler.start()
+        except RuntimeError:
+            await interaction.response.send_message("A profile is already running.", ephemeral=True)
             return
-    await _upsert_dashboard_message(ch)
 
-def _build_next7_embed(days: list[dict]) -> discord.Embed:
+    try:
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        if mode == "sample":
+            before = smp.snapshot()
+            await asyncio.sleep(seconds)
+            text = profiler.format_samples(before, smp.snapshot(), seconds)
+        else:
+            await asyncio.sleep(seconds)
+    finally:
+        if mode == "sample":
+            profiler.release_sampler()
+        else:
+            text = profiler.stop()
+    if _worker is not None:
+        text = "note: SHEETS_WORKER=1, Sheets calls run in the worker process and are not included\n\n" + text
+    await interaction.followup.send(
+        f"{mode} profile over {seconds}s:",
+        file=discord.File(io.BytesIO(text.encode("utf-8")), filename=f"profile-{mode}.txt"),
+        ephemeral=True
+    )
+
+@tasks.loop(minutes=5)
+async def memory_budget_loop():
+    rss = memprof.rss_mb()
+    if rss > RSS_BUDGET_MB:
+        print(f"[memory] RSS {rss:.1f} MiB over budget {RSS_BUDGET_MB} MiB")
+        if memprof.tracemalloc.is_tracing():
+            print(await asyncio.to_thread(memprof.report, 10, RSS_BUDGET_MB))
+
+# ----- warm-start snapshot -----
+
+async def _load_snapshot():
+    t0 = perf_counter()
+    state = await asyncio.to_thread(snapshot.load)
+    if state is None:
+        return
+    await _sheets(sheets.import_state, state)
+    age_min = (datetime.now().timestamp() - state["saved_at"]) / 60
+    print(f"[snapshot] warm start from revision {state['rev']} ({age_min:.0f} min old, "
+          f"{sum(len(r) for r in state['blocks'].values())} rows) in {(perf_counter() - t0) * 1000:.1f}ms")
+
+async def _save_snapshot():
+    if not _is_leader():
+        return  # one shared snapshot file, written by the leader only
+    try:
+        state = await _sheets(sheets.export_state)
+        if not state["rev"]:
+            return  # nothing read yet
+        size = await asyncio.to_thread(snapshot.save, state)
+        print(f"[snapshot] saved revision {state['rev']} ({size} bytes)")
+    except Exception as e:
+        print(f"[snapshot] save failed: {e}")
+
+_LEADER_LOOPS = (reminder_loop, daily_refresh_loop, next7_dashboard_loop, journal_apply_loop)
+
+def _start_leader_duties():
+    if _elector is not None:
+        # the previous leader may have changed the shared data dir since we loaded it
+        availability.reload()
+        pending = journal.recover(reload=True)
+        if pending:
+            print(f"[journal] {pending} pending mutations from the previous leader")
+    for loop in _LEADER_LOOPS:
+        if not loop.is_running():
+            loop.start()
+    # Revalidate (another leader may have written meanwhile) and update the dashboard in the background
+    asyncio.create_task(_revalidate_and_refresh())
+
+def _stop_leader_duties():
+    for loop in _LEADER_LOOPS:
+        if loop.is_running():
+            loop.cancel()
+
+async def _revalidate_and_refresh():
+    with tracing.span("startup.revalidate", root=True) as sp:
+        try:
+            sp.set(kept=await _sheets(sheets.ensure_fresh, True))
+        except Exception as e:
+            print(f"[snapshot] revalidation failed: {e}")
+    await client.wait_until_ready()
+    if _is_leader():
+        _schedule_changed()
+
+@tasks.loop(minutes=10)
+@tracing.traced("loop.snapshot")
+async def snapshot_loop():
+    await _save_snapshot()
+
+@snapshot_loop.before_loop
+async def _wait_snapshot_ready():
+    await client.wait_until_ready()
+
+# ----- /next: paged upcoming window, pre-rendered and served from memory -----
+
+_next_pages: dict[bool, list[discord.Embed]] | None = None  # show_names -> last rendered pages
+_next_pages_gen = 0                                           # bumped by every invalidation
+_next_pages_at = -1                                           # generation _next_pages is current for
+_next_pages_lock = asyncio.Lock()
+
+def _render_next_pages(days: list[dict], show_names: bool, stale: datetime | None = None) -> list[discord.Embed]:
+    # planned raid weekdays (even if cancelled) plus any extra ✔ day
+    days = [d for d in days if d["flag"] == "✔" or datetime.strptime(d["date"], "%d.%m.%Y").weekday() in PLANNED_DAYS]
+    chunks = [days[i:i + NEXT_PAGE_DAYS] for i in range(0, len(days), NEXT_PAGE_DAYS)] or [[]]
+    pages = []
+    for i, chunk in enumerate(chunks, start=1):
+        embed = discord.Embed(title="Upcoming Raid Days", color=EMBED_COLOR)
+        lines = []
+        for d in chunk:
+            line = f"{d['flag']} **{d['date']}** ({d['weekday']})"
+            if show_names and d["names"]:
+                line += f" — can't: {', '.join(d['names'])}"
+            lines.append(line)
+        embed.description = "\n".join(lines) or "_No upcoming raid days found._"
+        footer = f"Page {i}/{len(chunks)}"
+        if stale:
+            footer += f" • ⚠ Sheets unreachable, data from {stale:%d.%m. %H:%M}"
+        embed.set_footer(text=footer)
+        pages.append(embed)
+    return pages
+
+def _invalidate_next_pages():
+    """Mark the rendered pages outdated; they keep serving button clicks until the re-render swaps them."""
+    global _next_pages_gen
+    _next_pages_gen += 1
+
+async def _get_next_pages(show_names: bool) -> list[discord.Embed]:
+    """Current pages, re-rendered from the sheet if a write outdated them."""
+    global _next_pages, _next_pages_at
+    async with _next_pages_lock:
+        if _next_pages_at != _next_pages_gen:
+            gen = _next_pages_gen
+            days, stale = await _sheets_or_stale(sheets.get_schedule)
+            if stale:
+                return _render_next_pages(days, show_names, stale)  # not kept
+            # newer than what we had even if a write landed during the fetch; that write
+            # bumped the generation, so the next call renders again
+            _next_pages = {False: _render_next_pages(days, False), True: _render_next_pages(days, True)}
+            _next_pages_at = gen
+            availability.load_days(days)
+        return _next_pages[show_names]
+
+def _schedule_changed():
+    """Call after every write: drop rendered /next pages, then refresh the dashboard (which re-renders them)."""
+    _invalidate_next_pages()
+    asyncio.create_task(_refresh_next7_now())
+
+class NextView(discord.ui.View):
+    def __init__(self, owner_id: int, show_names: bool):
+        super().__init__(timeout=600)
+        self.owner_id = owner_id
+        self.page = 0
+        self.show_names = show_names
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.owner_id
+
+    async def _show(self, interaction: discord.Interaction, delta: int):
+        # clicks never wait for Sheets: the last rendered pages answer them, even while a
+        # write has them re-rendering in the background
+        if _next_pages is not None:
+            pages = _next_pages[self.show_names]
+            edit = interaction.response.edit_message
+        else:
+            await interaction.response.defer()
+            pages = await _get_next_pages(self.show_names)
+            edit = interaction.edit_original_response
+        self.page = max(0, min(len(pages) - 1, self.page + delta))
+        self.prev_btn.disabled = self.page == 0
+        self.next_btn.disabled = self.page >= len(pages) - 1
+        self.names_btn.label = "Hide names" if self.show_names else "Show names"
+        await edit(embed=pages[self.page], view=self)
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def prev_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, -1)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, +1)
+
+    @discord.ui.button(label="Show names", style=discord.ButtonStyle.primary)
+    async def names_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.show_names = not self.show_names
+        await self._show(interaction, 0)
+
+@client.tree.command(
+    name="next",
+    description="Browse all upcoming raid days (buttons to page).",
+    guild=discord.Object(id=GUILD_ID)
+)
+@app_commands.describe(names="Show who can't come")
+@tracing.traced("/next")
+async def next_cmd(interaction: discord.Interaction, names: bool = False):
+    if interaction.channel_id != CHANNEL_ID:
+        await interaction.response.send_message("Only in schedule-commands please :/", ephemeral=True)
+        return
+    if _next_pages is None:
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        pages = await _get_next_pages(names)
+        send = interaction.followup.send
+    else:
+        pages = _next_pages[names]
+        send = interaction.response.send_message
+    view = NextView(interaction.user.id, names)
+    view.prev_btn.disabled = True
+    view.next_btn.disabled = len(pages) <= 1
+    view.names_btn.label = "Hide names" if names else "Show names"
+    await send(embed=pages[0], view=view, ephemeral=True)
+
+async def _refresh_next7_now():
+    if not _is_leader():
+        return  # the leader owns the dashboard message
+    # fire-and-forget after writes: its own trace, linked to the command that caused it
+    with tracing.span("dashboard.refresh", root=True):
+        ch = client.get_channel(CHANNEL_ID)
+        if ch is None:
+            try:
+                ch = await client.fetch_channel(CHANNEL_ID)
+            except Exception as e:
+                print(f"[next7] fetch_channel failed: {e}")
+                return
+        await _upsert_dashboard_message(ch)
+
+def _build_next7_embed(days: list[dict], stale: datetime | None = None) -> discord.Embed:
     # Title + timestamp give you the nice header + left color bar
     embed = discord.Embed(
         title="Next 7 Raid Days",
         description="",                   # we’ll fill below
         color=EMBED_COLOR,
-        timestamp=dtime(tz=BERLIN)
+        timestamp=datetime.now(BERLIN)
     )
 
     # Optional banner at the top of the card
@@ -422,12 +1391,16 @@ def _build_next7_embed(days: list[dict]) -> discord.Embed:
 
     # A subtle divider + footer
     embed.add_field(name="\u200b", value="—", inline=False)
-    embed.set_footer(text="Updates daily • Sheet-driven")
+    if stale:
+        embed.set_footer(text=f"⚠ Sheets unreachable • data from {stale:%d.%m. %H:%M}")
+    else:
+        embed.set_footer(text="Updates daily • Sheet-driven")
 
     return embed
 
 
-client.run(BOT_TOKEN)
+if __name__ == "__main__":
+    client.run(BOT_TOKEN)
 
 
 
@@ -0,0 +1,178 @@
+# attendance.py
+import os, json, tempfile, threading
+from datetime import datetime, date, timedelta
+
+DATA_DIR     = os.getenv("BOT_DATA_DIR", "data")
+ARCHIVE_PATH = os.path.join(DATA_DIR, "attendance_archive.jsonl")  # append-only, one row per past date
+AGG_PATH     = os.path.join(DATA_DIR, "attendance_agg.json")       # precomputed aggregates
+
+PLANNED_DAYS = {0, 2, 3}  # Mo=0, Mi=2, Do=3
+KEEP_WEEKS   = 12         # longest rolling window we answer for
+
+_lock = threading.RLock()
+_agg: dict | None = None
+_stamp: tuple | None = None  # (mtime, size) of the archive _agg was loaded against
+
+
+def _empty_agg() -> dict:
+    return {
+        "last_date": "",  # ISO date of the newest archived row
+        "users": {},      # name_lower -> {"name": str, "cant": int}
+        "weekday": {str(wd): {"planned": 0, "cancelled": 0} for wd in sorted(PLANNED_DAYS)},
+        "weeks": {},      # ISO monday -> {"planned": int, "cancelled": int, "cant": {name_lower: int}}
+    }
+
+def _week_key(d: date) -> str:
+    return (d - timedelta(days=d.weekday())).isoformat()
+
+def _apply_row(agg: dict, row: dict):
+    """Fold one archived row into the aggregates (O(len(names)))."""
+    d = date.fromisoformat(row["date"])
+    agg["last_date"] = row["date"]
+    if d.weekday() not in PLANNED_DAYS:
+        return
+
+    cancelled = row.get("flag") == "✖"
+    wd = agg["weekday"].setdefault(str(d.weekday()), {"planned": 0, "cancelled": 0})
+    wd["planned"] += 1
+    wd["cancelled"] += int(cancelled)
+
+    wk = agg["weeks"].setdefault(_week_key(d), {"planned": 0, "cancelled": 0, "cant": {}})
+    wk["planned"] += 1
+    wk["cancelled"] += int(cancelled)
+
+    for name in row.get("names", []):
+        key = name.lower()
+        u = agg["users"].setdefault(key, {"name": name, "cant": 0})
+        u["name"] = name
+        u["cant"] += 1
+        wk["cant"][key] = wk["cant"].get(key, 0) + 1
+
+    # only the newest KEEP_WEEKS buckets are ever read
+    oldest = (d - timedelta(days=d.weekday(), weeks=KEEP_WEEKS)).isoformat()
+    for k in [k for k in agg["weeks"] if k < oldest]:
+        del agg["weeks"][k]
+
+def _save_agg(agg: dict):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    # unique temp name: the bot and the Sheets worker may both save after a replay
+    fd, tmp = tempfile.mkstemp(dir=DATA_DIR, prefix=os.path.basename(AGG_PATH) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(agg, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, AGG_PATH)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def _archive_stamp() -> tuple | None:
+    try:
+        st = os.stat(ARCHIVE_PATH)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+def _load() -> dict:
+    """
+    Current aggregates. They are re-read when the archive changed on disk, so the
+    bot sees rows archived by the Sheets worker process (SHEETS_WORKER=1) or by
+    another leader. If a process died between appending to the archive and
+    saving the aggregates, the archive tail past agg['last_date'] is replayed.
+    """
+    global _agg, _stamp
+    stamp = _archive_stamp()
+    with _lock:
+        if _agg is not None and stamp == _stamp:
+            return _agg
+        _agg, _stamp = _read_agg(), stamp
+        return _agg
+
+def _read_agg() -> dict:
+    try:
+        with open(AGG_PATH, encoding="utf-8") as f:
+            agg = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        agg = _empty_agg()
+
+    replayed = 0
+    if os.path.exists(ARCHIVE_PATH):
+        with open(ARCHIVE_PATH, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line after a crash
+                if row["date"] > agg["last_date"]:
+                    _apply_row(agg, row)
+                    replayed += 1
+    if replayed:
+        _save_agg(agg)
+        print(f"[attendance] replayed {replayed} archived rows into aggregates")
+    return agg
+
+def archive_rows(rows: list[tuple[str, str, list[str]]]) -> int:
+    """
+    Archive past schedule rows [(dd.mm.yyyy, flag, names)] before they roll off the sheet.
+    Dates already archived are skipped, so calling this on every refresh is safe.
+    Returns the number of newly archived rows.
+    """
+    global _stamp
+    with _lock:
+        agg = _load()
+        fresh = []
+        for date_s, flag, names in rows:
+            d = datetime.strptime(date_s, "%d.%m.%Y").date()
+            if d.isoformat() > agg["last_date"]:
+                fresh.append({"date": d.isoformat(), "flag": flag, "names": names})
+        if not fresh:
+            return 0
+        fresh.sort(key=lambda r: r["date"])
+
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(ARCHIVE_PATH, "a", encoding="utf-8") as f:
+            for row in fresh:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        for row in fresh:
+            _apply_row(agg, row)
+        _save_agg(agg)
+        _stamp = _archive_stamp()  # our own append, already folded in
+        return len(fresh)
+
+def _window(weeks: int, today: date | None = None) -> list[dict]:
+    today = today or date.today()
+    monday = today - timedelta(days=today.weekday())
+    agg = _load()
+    out = []
+    for i in range(weeks):
+        wk = agg["weeks"].get((monday - timedelta(weeks=i)).isoformat())
+        if wk:
+            out.append(wk)
+    return out
+
+def rolling_attendance(name: str, weeks: int) -> tuple[int, int] | None:
+    """
+    (planned raid days available, planned raid days) over the last `weeks` weeks,
+    or None if no data. A day counts against the user when they were listed as
+    can't, which is also what flips it to ✖, so cancelled days are not excluded.
+    """
+    key = name.lower()
+    planned = cant = 0
+    for wk in _window(weeks):
+        planned += wk["planned"]
+        cant += wk["cant"].get(key, 0)
+    if not planned:
+        return None
+    return planned - cant, planned
+
+def user_cant_count(name: str) -> int:
+    u = _load()["users"].get(name.lower())
+    return u["cant"] if u else 0
+
+def weekday_cancellation_rates() -> dict[int, tuple[int, int]]:
+    """weekday -> (cancelled, planned) over the whole archive."""
+    return {int(wd): (v["cancelled"], v["planned"]) for wd, v in _load()["weekday"].items()}
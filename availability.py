@@ -0,0 +1,150 @@
+# availability.py
+"""
+Who of the core roster can come, per date, as bitsets.
+
+The roster (data/roster.json) gives every core player a bit; each date keeps
+one int with the bits of roster members listed as can't. "How many can come"
+is then roster_size - (mask & roster_bits).bit_count(), so ranking the whole
+window is one popcount per date. Names outside the roster are ignored.
+
+Fed from sheets_client.get_schedule() (load_days) and from write results
+(apply_results); both carry the recurring rules overlay (rules.py), so the
+names here are what /next shows. Everything runs on the event loop, no locking.
+"""
+import os, json
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+import rules
+
+DATA_DIR    = os.getenv("BOT_DATA_DIR", "data")
+ROSTER_PATH = os.path.join(DATA_DIR, "roster.json")
+BERLIN      = ZoneInfo("Europe/Berlin")
+
+_roster: list[str] | None = None          # display names, bit i = _roster[i]
+_bit: dict[str, int] = {}                 # name_lower -> bit index
+_days: dict[str, tuple[int, str, str]] = {}  # dd.mm.yyyy -> (ordinal, weekday, flag)
+_names: dict[str, list[str]] = {}         # dd.mm.yyyy -> names as in the sheet
+_cant: dict[str, int] = {}                # dd.mm.yyyy -> bitset of roster members who can't
+
+
+def _load_roster() -> list[str]:
+    global _roster
+    if _roster is None:
+        try:
+            with open(ROSTER_PATH, encoding="utf-8") as f:
+                _roster = list(json.load(f))
+        except (OSError, json.JSONDecodeError):
+            _roster = []
+        _reindex()
+    return _roster
+
+def _save_roster():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    tmp = ROSTER_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_roster, f, ensure_ascii=False)
+    os.replace(tmp, ROSTER_PATH)
+
+def _mask(names: list[str]) -> int:
+    m = 0
+    for n in names:
+        b = _bit.get(n.strip().lower())
+        if b is not None:
+            m |= 1 << b
+    return m
+
+def _reindex():
+    """Bit positions changed: rebuild the index and every date's bitset from the stored names."""
+    _bit.clear()
+    _bit.update({n.lower(): i for i, n in enumerate(_roster)})
+    for d, names in _names.items():
+        _cant[d] = _mask(names)
+
+def reload():
+    """Re-read roster.json on next use (another instance may have changed it)."""
+    global _roster
+    _roster = None
+
+def roster() -> list[str]:
+    return list(_load_roster())
+
+def add_member(name: str) -> bool:
+    name = name.strip()
+    _load_roster()
+    if not name or name.lower() in _bit:
+        return False
+    _roster.append(name)
+    _save_roster()
+    _reindex()
+    return True
+
+def remove_member(name: str) -> bool:
+    _load_roster()
+    idx = _bit.get(name.strip().lower())
+    if idx is None:
+        return False
+    del _roster[idx]
+    _save_roster()
+    _reindex()
+    return True
+
+
+def load_days(days: list[dict]):
+    """Replace the window with get_schedule() output."""
+    _load_roster()
+    _days.clear()
+    _names.clear()
+    _cant.clear()
+    for d in days:
+        try:
+            ordinal = datetime.strptime(d["date"], "%d.%m.%Y").toordinal()
+        except ValueError:
+            continue
+        _days[d["date"]] = (ordinal, d["weekday"], d["flag"])
+        _names[d["date"]] = list(d["names"])
+        _cant[d["date"]] = _mask(d["names"])
+
+def apply_results(results: dict[str, tuple[str, str]]):
+    """Fold apply_name_mutations() results {date: (flag, joined_names)} into the window."""
+    active = rules.active()
+    for date_str, (flag, joined) in results.items():
+        if date_str not in _days:
+            continue
+        ordinal, weekday, _old = _days[date_str]
+        # results are raw sheet cells; add the rule users like get_schedule() does
+        flag, names = rules.overlay(date.fromordinal(ordinal), flag,
+                                    [p.strip() for p in joined.split(",") if p.strip()], active)
+        _days[date_str] = (ordinal, weekday, flag)
+        _names[date_str] = names
+        _cant[date_str] = _mask(names)
+
+def loaded() -> bool:
+    return bool(_days)
+
+def available(date_str: str) -> int | None:
+    if date_str not in _cant:
+        return None
+    return len(_load_roster()) - _cant[date_str].bit_count()
+
+def best_days(min_players: int = 0, limit: int = 10, today: date | None = None) -> list[dict]:
+    """
+    Upcoming dates with at least min_players of the roster available, most
+    available first (earlier date on ties).
+    Items: {"date", "weekday", "flag", "available", "missing": [names]}
+    """
+    size = len(_load_roster())
+    start = (today or datetime.now(BERLIN).date()).toordinal()
+    ranked = []
+    for d, mask in _cant.items():
+        ordinal, _wd, _flag = _days[d]
+        free = size - mask.bit_count()
+        if ordinal >= start and free >= min_players:
+            ranked.append((-free, ordinal, d))
+    ranked.sort()
+    out = []
+    for neg_free, _o, d in ranked[:limit]:
+        mask = _cant[d]
+        _o2, weekday, flag = _days[d]
+        out.append({"date": d, "weekday": weekday, "flag": flag, "available": -neg_free,
+                    "missing": [_roster[i] for i in range(size) if mask >> i & 1]})
+    return out
@@ -0,0 +1,39 @@
+# coalesce.py
+"""
+Write coalescing for /cant and /can. With COALESCE_WINDOW_S > 0 every command
+is journaled and acknowledged at once (journal.py); the applier waits until
+the oldest pending entry is a window old and then writes everything pending
+in one go. Entries are keyed by (date, user): only the user's last command for
+a date survives (a /cant followed by /can seconds later folds into the /can).
+apply_name_mutations skips cells that end up unchanged, so a cancelling pair
+costs no write at all.
+"""
+import time
+
+
+class Coalescer:
+    def __init__(self, window_s: float):
+        self.window_s = window_s
+        self.submitted = 0
+        self.folded = 0   # commands that never reached the sheet on their own
+        self.flushes = 0
+
+    def due(self, entries: list[dict], now: float | None = None) -> bool:
+        """True once the oldest entry has waited out the window (entries without a stamp count as old)."""
+        now = time.time() if now is None else now
+        return bool(entries) and entries[0].get("ts", 0.0) + self.window_s <= now
+
+    @staticmethod
+    def fold(entries: list[dict]) -> list[tuple[str, str, str]]:
+        """Journal entries in order -> their net (op, date, user) mutations, one per (date, user)."""
+        net: dict[tuple[str, str], tuple[str, str, str]] = {}
+        for e in entries:
+            key = (e["date"], e["user"].lower())
+            net.pop(key, None)  # re-insert: the batch keeps the order of the last commands
+            net[key] = (e["op"], e["date"], e["user"])
+        return list(net.values())
+
+    def flushed(self, entries: int, mutations: int):
+        self.submitted += entries
+        self.folded += entries - mutations
+        self.flushes += 1
@@ -0,0 +1,71 @@
+# fanout.py
+"""
+Reminder delivery helpers: split mentions into messages that fit Discord's
+2000-character limit, and send many messages concurrently without tripping
+rate limits.
+
+discord.py already waits out per-route buckets internally; RateLimitedSender
+adds a concurrency cap and, when a 429 still escapes, a shared pause taken
+from the response's Retry-After / X-RateLimit-Reset-After headers so every
+pending send backs off together instead of hammering the same bucket.
+"""
+import asyncio, time
+import discord
+
+MESSAGE_LIMIT = 2000
+
+
+def chunk_mentions(prefix: str, user_ids: list[int], limit: int = MESSAGE_LIMIT) -> list[tuple[str, list[int]]]:
+    """[(message, user_ids in it)]; every message is prefix + mentions and at most `limit` chars."""
+    chunks: list[tuple[str, list[int]]] = []
+    text, ids = prefix, []
+    for uid in user_ids:
+        mention = f" <@{uid}>"
+        if ids and len(text) + len(mention) > limit:
+            chunks.append((text, ids))
+            text, ids = prefix, []
+        text += mention
+        ids.append(uid)
+    if ids:
+        chunks.append((text, ids))
+    return chunks
+
+def _retry_after(e: discord.HTTPException) -> float:
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    for key in ("Retry-After", "X-RateLimit-Reset-After"):
+        try:
+            return float(headers[key])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return 1.0
+
+
+class RateLimitedSender:
+    def __init__(self, concurrency: int = 5, max_attempts: int = 3):
+        self._sem = asyncio.Semaphore(concurrency)
+        self._resume_at = 0.0  # monotonic time before which nobody sends
+        self._max_attempts = max_attempts
+
+    async def run(self, make_call) -> bool:
+        """Await make_call() under the limiter; True on success, False once it gives up."""
+        for attempt in range(1, self._max_attempts + 1):
+            async with self._sem:
+                wait = self._resume_at - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                try:
+                    await make_call()
+                    return True
+                except discord.Forbidden:
+                    return False  # closed DMs, missing permission: retrying won't help
+                except discord.HTTPException as e:
+                    if e.status != 429 and e.status < 500:
+                        print(f"[fanout] send failed ({e.status}): {e}")
+                        return False
+                    pause = _retry_after(e) if e.status == 429 else float(attempt)
+                    self._resume_at = max(self._resume_at, time.monotonic() + pause)
+                    print(f"[fanout] {e.status} on attempt {attempt}; pausing {pause:.1f}s")
+                except Exception as e:
+                    print(f"[fanout] send error on attempt {attempt}: {e}")
+                    self._resume_at = max(self._resume_at, time.monotonic() + attempt)
+        return False
@@ -0,0 +1,90 @@
+# journal.py
+"""
+Write-ahead journal for schedule mutations (ACK_BEFORE_WRITE mode).
+
+Each /cant or /can is appended here (fsync'd) before the user gets the
+confirmation; a background applier replays pending entries into the sheet in
+one batch and truncates the journal afterwards. add/remove are set operations,
+so replaying an entry that already reached the sheet is harmless. Entries carry
+their append time, so the applier can hold them for the coalescing window
+(coalesce.py).
+"""
+import os, json, threading, time
+
+DATA_DIR     = os.getenv("BOT_DATA_DIR", "data")
+JOURNAL_PATH = os.path.join(DATA_DIR, "mutations.wal")
+
+_lock = threading.Lock()
+_entries: list[dict] | None = None  # in-memory mirror of the file
+_next_seq = 1
+
+
+def recover(reload: bool = False) -> int:
+    """
+    Load entries left over from a previous run (call once at startup). Returns how
+    many are pending. reload=True re-reads the file: a new leader picks up what
+    the previous one acknowledged (shared BOT_DATA_DIR).
+    """
+    global _entries, _next_seq
+    with _lock:
+        if _entries is not None and not reload:
+            return len(_entries)
+        _entries = []
+        torn = False
+        if os.path.exists(JOURNAL_PATH):
+            with open(JOURNAL_PATH, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line) if line.endswith("\n") else None
+                    except json.JSONDecodeError:
+                        entry = None
+                    if entry is None:
+                        torn = True  # torn tail from a crash mid-append: never acknowledged
+                        break
+                    _entries.append(entry)
+        if torn:
+            # cut it off before the next append lands on the partial line
+            _rewrite(_entries)
+        if _entries:
+            _next_seq = _entries[-1]["seq"] + 1
+        return len(_entries)
+
+def append(op: str, date_str: str, user_name: str) -> int:
+    """Durably record one mutation ('add' | 'remove'). Returns its sequence number."""
+    global _next_seq
+    recover()
+    with _lock:
+        entry = {"seq": _next_seq, "op": op, "date": date_str, "user": user_name, "ts": time.time()}
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(JOURNAL_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        _entries.append(entry)
+        _next_seq += 1
+        return entry["seq"]
+
+def pending() -> list[dict]:
+    recover()
+    with _lock:
+        return list(_entries)
+
+def truncate(upto_seq: int):
+    """Drop entries with seq <= upto_seq (they reached the sheet); entries appended meanwhile stay."""
+    global _entries
+    recover()
+    with _lock:
+        keep = [e for e in _entries if e["seq"] > upto_seq]
+        _rewrite(keep)
+        _entries = keep
+
+def _rewrite(entries: list[dict]):
+    """Atomically replace the file with entries (caller holds _lock)."""
+    tmp = JOURNAL_PATH + ".tmp"
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(tmp, "w", encoding="utf-8") as f:
+        for e in entries:
+            f.write(json.dumps(e, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, JOURNAL_PATH)
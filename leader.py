@@ -0,0 +1,220 @@
+# leader.py
+"""
+Leader election for running several Bot.py instances (active/standby).
+
+Instances compete for one lease {owner, expires}. The holder renews it every
+ttl/3 seconds; a standby takes over once the lease has expired, so failover
+takes at most ttl + ttl/3 seconds. Only the leader runs the scheduled loops,
+writes to the sheet and answers interactions (see Bot.py).
+
+All instances must share one BOT_DATA_DIR (same host or a shared volume):
+rules.json, roster.json, the attendance archive and the ACK_BEFORE_WRITE
+journal live there, and a new leader reloads them on election (Bot.py), so
+acknowledged /cant entries and rules survive a failover. Bot.py refuses to
+elect without an explicit BOT_DATA_DIR.
+
+Backends (LEADER_BACKEND):
+  file    fcntl-locked JSON file in the data dir
+  sqlite  one row in a SQLite table in the data dir; handy for tests
+  sheet   E3:H3 on the Schedule tab (key 'Leader'), for volumes where file
+          locks are unreliable (NFS). Sheets has no compare-and-set, so a
+          claim is written, then read back after a settle delay: of two
+          racing writers only the last one sees itself. The lease carries the
+          data dir's id (leader.dirid, moves with the data), and an instance
+          whose data dir has another id never takes over. Leases use
+          wall-clock time: hosts need NTP. Needs SHEETS_REVISION_SOURCE=stamp:
+          every renewal moves the Drive file version, which would drop the
+          sheet caches each time.
+"""
+import asyncio, json, os, sqlite3, time, uuid
+from contextlib import closing
+
+
+class FileLease:
+    def __init__(self, path: str):
+        self.path = path
+
+    def _locked(self, fn):
+        import fcntl
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    cur = json.loads(f.read() or "{}")
+                except json.JSONDecodeError:
+                    cur = {}
+                new = fn(cur)
+                if new is not None:
+                    f.seek(0)
+                    f.truncate()
+                    json.dump(new, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                return new is not None
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def try_acquire(self, owner: str, ttl_s: float) -> bool:
+        now = time.time()
+        def claim(cur):
+            if cur.get("owner") not in (None, owner) and cur.get("expires", 0) > now:
+                return None
+            return {"owner": owner, "expires": now + ttl_s}
+        return self._locked(claim)
+
+    def release(self, owner: str):
+        self._locked(lambda cur: {} if cur.get("owner") == owner else None)
+
+
+class SqliteLease:
+    def __init__(self, path: str, name: str = "leader"):
+        self.path, self.name = path, name
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        con = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        con.execute("CREATE TABLE IF NOT EXISTS lease (name TEXT PRIMARY KEY, owner TEXT, expires REAL)")
+        return con
+
+    def try_acquire(self, owner: str, ttl_s: float) -> bool:
+        now = time.time()
+        with closing(self._connect()) as con:
+            con.execute("BEGIN IMMEDIATE")
+            row = con.execute("SELECT owner, expires FROM lease WHERE name = ?", (self.name,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                con.execute("ROLLBACK")
+                return False
+            con.execute(
+                "INSERT INTO lease (name, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires",
+                (self.name, owner, now + ttl_s)
+            )
+            con.execute("COMMIT")
+            return True
+
+    def release(self, owner: str):
+        with closing(self._connect()) as con:
+            con.execute("DELETE FROM lease WHERE name = ? AND owner = ?", (self.name, owner))
+
+
+def data_dir_id(data_dir: str) -> str:
+    """Random id of the data dir, created on first use; equal ids mean a shared dir."""
+    path = os.path.join(data_dir, "leader.dirid")
+    os.makedirs(data_dir, exist_ok=True)
+    try:
+        with open(path, "x", encoding="utf-8") as f:
+            f.write(uuid.uuid4().hex)
+    except FileExistsError:
+        pass
+    with open(path, encoding="utf-8") as f:
+        return f.read().strip()
+
+
+class SheetLease:
+    def __init__(self, dir_id: str, settle_s: float = 1.0):
+        self.dir_id = dir_id
+        self.settle_s = settle_s
+
+    def try_acquire(self, owner: str, ttl_s: float) -> bool:
+        import sheets_client as sheets
+        cur = sheets.read_lease()
+        if cur and cur[2] and cur[2] != self.dir_id:
+            raise RuntimeError(f"the lease was last held with a different BOT_DATA_DIR ({cur[0] or 'released'}); "
+                               "instances must share it")
+        if cur and cur[0] and cur[0] != owner and cur[1] > time.time():
+            return False
+        renewing = cur is not None and cur[0] == owner
+        sheets.write_lease(owner, time.time() + ttl_s, self.dir_id)
+        if renewing:
+            return True
+        time.sleep(self.settle_s)  # let a racing claim land, then see who won
+        cur = sheets.read_lease()
+        return cur is not None and cur[0] == owner
+
+    def release(self, owner: str):
+        import sheets_client as sheets
+        cur = sheets.read_lease()
+        if cur and cur[0] == owner:
+            sheets.write_lease("", 0.0, self.dir_id)  # keeps the dir id for the check above
+
+
+def make_backend(kind: str, data_dir: str):
+    if kind == "file":
+        return FileLease(os.path.join(data_dir, "leader.lease"))
+    if kind == "sqlite":
+        return SqliteLease(os.path.join(data_dir, "leader.sqlite"))
+    if kind == "sheet":
+        import sheets_client as sheets
+        if sheets.REVISION_SOURCE != "stamp":
+            raise ValueError("LEADER_BACKEND=sheet needs SHEETS_REVISION_SOURCE=stamp: "
+                             "lease renewals move the Drive file version")
+        return SheetLease(data_dir_id(data_dir))
+    raise ValueError(f"unknown LEADER_BACKEND {kind!r} (file | sqlite | sheet)")
+
+
+class Elector:
+    def __init__(self, backend, owner: str, ttl_s: float = 15.0):
+        self.backend = backend
+        self.owner = owner
+        self.ttl_s = ttl_s
+        self._held_until = 0.0   # monotonic; leadership lapses here unless renewed
+        self._leader = False
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader and time.monotonic() < self._held_until
+
+    def start(self, on_elected, on_demoted):
+        """Campaign/renew in the background; callbacks are plain functions run on the loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(on_elected, on_demoted))
+
+    async def _run(self, on_elected, on_demoted):
+        check: asyncio.Future | None = None
+        while True:
+            if check is None:
+                t0 = time.monotonic()
+                check = asyncio.ensure_future(asyncio.to_thread(self.backend.try_acquire, self.owner, self.ttl_s))
+            # a hung backend call (Sheets has no socket timeout) must not outlive the lease:
+            # the leader waits only until it lapses, a standby a third of the ttl
+            limit = self._held_until - time.monotonic() if self._leader else self.ttl_s / 3
+            done, _ = await asyncio.wait({check}, timeout=max(0.0, limit))
+            if done:
+                try:
+                    held = check.result()
+                except Exception as e:
+                    print(f"[leader] lease check failed: {e}")
+                    held = None  # unknown: keep what we have until it runs out
+                check = None
+            else:
+                # the call keeps running in its thread and is awaited again next round;
+                # no new check starts until it returns
+                print(f"[leader] lease check still running after {time.monotonic() - t0:.1f}s")
+                held = False
+            if held:
+                self._held_until = t0 + self.ttl_s
+            elif held is False:
+                self._held_until = 0.0
+            if (time.monotonic() < self._held_until) != self._leader:
+                self._leader = not self._leader
+                print(f"[leader] {self.owner} is now {'LEADER' if self._leader else 'standby'}")
+                (on_elected if self._leader else on_demoted)()
+            if check is None:
+                wait = self.ttl_s / 3
+                if self._leader:
+                    wait = min(wait, max(0.0, self._held_until - time.monotonic()))  # notice a lapse on time
+                await asyncio.sleep(wait)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._leader:
+            self._leader = False
+            try:
+                await asyncio.to_thread(self.backend.release, self.owner)  # standby takes over right away
+            except Exception as e:
+                print(f"[leader] release failed: {e}")
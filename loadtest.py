@@ -0,0 +1,232 @@
+# loadtest.py
+"""
+Slash-command storm against the in-memory Sheets stand-in (no Discord, no Google).
+
+    python loadtest.py --users 40 --bursts 3 --rate 20 --latency-ms 80
+
+Builds fake discord.Interaction objects and calls the command callbacks
+(cant, can_cmd, remind_on, next7_cmd) concurrently, then reports per burst:
+  - p50/p95/p99 defer -> followup latency per command
+  - thread-pool queueing (submit -> start) for the to_thread calls
+  - lost updates: (date, user) pairs whose final sheet state differs from
+    that user's last command for the date
+  - dashboard edits/posts triggered by the burst
+  - with the journal (--ack or --coalesce > 0): commands folded before the write and flushes
+"""
+import argparse, asyncio, os, random, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+
+ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+ap.add_argument("--users", type=int, default=30, help="virtual users per burst")
+ap.add_argument("--ops", type=int, default=4, help="commands per user per burst")
+ap.add_argument("--bursts", type=int, default=3)
+ap.add_argument("--rate", type=float, default=20.0, help="command starts per second (whole burst)")
+ap.add_argument("--dates", type=int, default=3, help="how many upcoming raid days the storm targets")
+ap.add_argument("--latency-ms", type=float, default=80.0, help="simulated Sheets round trip")
+ap.add_argument("--threads", type=int, default=min(32, (os.cpu_count() or 1) + 4), help="to_thread pool size")
+ap.add_argument("--ack", action="store_true", help="run with ACK_BEFORE_WRITE=1")
+ap.add_argument("--coalesce", type=float, default=0.0, help="COALESCE_WINDOW_S for /cant and /can (0 = off; default matches Bot.py)")
+ap.add_argument("--seed", type=int, default=1)
+args = ap.parse_args()
+
+# Configure the stand-in BEFORE Bot/sheets_client are imported
+os.environ["SHEETS_BACKEND"] = "local"
+os.environ["SHEETS_LOCAL_LATENCY_MS"] = str(args.latency_ms)
+os.environ.setdefault("BOT_TOKEN", "loadtest")
+os.environ.setdefault("BOT_DATA_DIR", tempfile.mkdtemp(prefix="raidbot-load-"))
+if args.ack:
+    os.environ["ACK_BEFORE_WRITE"] = "1"
+os.environ["COALESCE_WINDOW_S"] = str(args.coalesce)
+
+import Bot
+import sheets_client as sheets
+import journal
+
+
+# ---------- fakes ----------
+
+class FakeUser:
+    def __init__(self, uid: int):
+        self.id = uid
+        self.name = f"user{uid}"
+        self.display_name = f"User{uid}"
+        self.discriminator = "0"
+
+class FakePermissions:
+    manage_guild = True
+
+class FakeMessage:
+    _ids = iter(range(10_000, 10**9))
+
+    def __init__(self, stats: dict):
+        self.id = next(FakeMessage._ids)
+        self._stats = stats
+
+    async def edit(self, **_kw):
+        self._stats["edits"] += 1
+
+class FakeChannel:
+    def __init__(self):
+        self.stats = {"edits": 0, "posts": 0}
+        self.messages: dict[int, FakeMessage] = {}
+
+    async def send(self, content=None, **_kw):
+        self.stats["posts"] += 1
+        msg = FakeMessage(self.stats)
+        self.messages[msg.id] = msg
+        return msg
+
+    async def fetch_message(self, msg_id: int):
+        if msg_id not in self.messages:
+            # the stored id may be from an earlier burst; pretend it still exists
+            self.messages[msg_id] = FakeMessage(self.stats)
+        return self.messages[msg_id]
+
+class FakeResponse:
+    def __init__(self, rec: dict):
+        self._rec = rec
+
+    async def defer(self, **_kw):
+        self._rec.setdefault("defer", time.perf_counter())
+
+    async def send_message(self, *_a, **_kw):
+        self._rec.setdefault("done", time.perf_counter())
+
+class FakeFollowup:
+    def __init__(self, rec: dict):
+        self._rec = rec
+
+    async def send(self, *_a, **_kw):
+        self._rec.setdefault("done", time.perf_counter())
+
+class FakeInteraction:
+    def __init__(self, user: FakeUser, channel: FakeChannel, rec: dict):
+        self.user = user
+        self.channel = channel
+        self.channel_id = Bot.CHANNEL_ID
+        self.permissions = FakePermissions()
+        self.response = FakeResponse(rec)
+        self.followup = FakeFollowup(rec)
+
+
+class QueueTimingPool(ThreadPoolExecutor):
+    """Default executor that records how long each to_thread call waited for a free thread."""
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self.waits: list[float] = []
+
+    def submit(self, fn, /, *a, **kw):
+        t_submit = time.perf_counter()
+
+        def timed(*a2, **kw2):
+            self.waits.append(time.perf_counter() - t_submit)
+            return fn(*a2, **kw2)
+        return super().submit(timed, *a, **kw)
+
+
+# ---------- storm ----------
+
+def _pct(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))]
+
+async def _run_cmd(kind: str, user: FakeUser, channel: FakeChannel, date_s: str, recs: list[dict]):
+    rec = {"kind": kind, "start": time.perf_counter()}
+    recs.append(rec)
+    inter = FakeInteraction(user, channel, rec)
+    if kind == "cant":
+        await Bot.cant.callback(inter, date_s)
+    elif kind == "can":
+        await Bot.can_cmd.callback(inter, date_s)
+    elif kind == "remind_on":
+        await Bot.remind_on.callback(inter, "17:00")
+    else:
+        await Bot.next7_cmd.callback(inter)
+
+async def _user_session(user: FakeUser, channel: FakeChannel, dates: list[str], start_at: float,
+                        rng: random.Random, recs: list[dict], expected: dict):
+    await asyncio.sleep(max(0.0, start_at - time.perf_counter()))
+    for _ in range(args.ops):
+        kind = rng.choices(["cant", "can", "remind_on", "next7"], weights=[5, 4, 1, 1])[0]
+        date_s = rng.choice(dates)
+        await _run_cmd(kind, user, channel, date_s, recs)
+        if kind == "cant":
+            expected[(date_s, user.display_name)] = True
+        elif kind == "can":
+            expected[(date_s, user.display_name)] = False
+
+async def _drain():
+    """Wait for dashboard tasks and the journal applier (flushed at once instead of after the window)."""
+    me = asyncio.current_task()
+    while True:
+        if journal.pending():
+            await Bot._apply_journal(force=True)
+        others = [t for t in asyncio.all_tasks() if t is not me and not t.done()]
+        if not others and not journal.pending():
+            return
+        await asyncio.gather(*others, return_exceptions=True)
+
+def _lost_updates(expected: dict) -> int:
+    sheets.invalidate_caches()
+    actual: dict[str, set[str]] = {}
+    for rows in sheets._all_blocks():
+        for r in rows:
+            if len(r) >= 2 and r[1]:
+                cell = r[3] if len(r) >= 4 else ""
+                actual[r[1].strip()] = {p.strip().lower() for p in cell.split(",") if p.strip()}
+    return sum(1 for (date_s, name), want in expected.items()
+               if (name.lower() in actual.get(date_s, set())) != want)
+
+async def main():
+    rng = random.Random(args.seed)
+    pool = QueueTimingPool(max_workers=args.threads, thread_name_prefix="loadtest")
+    asyncio.get_running_loop().set_default_executor(pool)
+
+    channel = FakeChannel()
+    Bot.client.get_channel = lambda _cid: channel
+
+    print(f"users={args.users} ops/user={args.ops} rate={args.rate}/s latency={args.latency_ms}ms "
+          f"threads={args.threads} ack={args.ack} coalesce={args.coalesce}s")
+    for burst in range(1, args.bursts + 1):
+        await asyncio.to_thread(sheets.rebuild_schedule)
+        sheets.invalidate_caches()
+        dates = [d["date"] for d in await asyncio.to_thread(sheets.get_next_raid_days, args.dates)]
+
+        recs: list[dict] = []
+        expected: dict = {}
+        pool.waits.clear()
+        channel.stats.update(edits=0, posts=0)
+        calls0 = sheets._svc.calls
+        t0 = time.perf_counter()
+        total = args.users * args.ops
+        spacing = args.ops / args.rate if args.rate > 0 else 0.0  # per-user stagger keeps the global rate
+        await asyncio.gather(*[
+            _user_session(FakeUser(1000 + u), channel, dates, t0 + (u * spacing / args.users), rng, recs, expected)
+            for u in range(args.users)
+        ])
+        t_cmds = time.perf_counter() - t0
+        await _drain()
+        t_all = time.perf_counter() - t0
+
+        print(f"\n=== burst {burst}: {total} commands in {t_cmds:.2f}s (drained {t_all:.2f}s), "
+              f"{sheets._svc.calls - calls0} Sheets calls ===")
+        for kind in ("cant", "can", "remind_on", "next7"):
+            lat = [(r["done"] - r.get("defer", r["start"])) * 1000 for r in recs if r["kind"] == kind and "done" in r]
+            if lat:
+                print(f"{kind:>10}: n={len(lat):4d}  p50={_pct(lat, 50):7.1f}ms  p95={_pct(lat, 95):7.1f}ms  "
+                      f"p99={_pct(lat, 99):7.1f}ms")
+        waits = [w * 1000 for w in pool.waits]
+        print(f"{'queueing':>10}: n={len(waits):4d}  p50={_pct(waits, 50):7.1f}ms  p95={_pct(waits, 95):7.1f}ms  "
+              f"max={max(waits, default=0):7.1f}ms")
+        print(f"{'lost':>10}: {_lost_updates(expected)} of {len(expected)} (date, user) pairs")
+        print(f"{'dashboard':>10}: {channel.stats['edits']} edits, {channel.stats['posts']} posts")
+        if Bot._JOURNALED:
+            co = Bot._coalescer
+            print(f"{'coalesce':>10}: {co.submitted} submitted, {co.folded} folded, {co.flushes} flushes")
+            co.submitted = co.folded = co.flushes = 0
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+# memprof.py
+"""
+Memory instrumentation: resident set size and tracemalloc snapshots grouped by module.
+Start tracing at boot with MEMTRACE=1 (or lazily via /memory); tracemalloc costs
+some CPU and memory of its own, so it is off by default.
+"""
+import os, sys, tracemalloc
+
+TRACE_FRAMES = int(os.getenv("MEMTRACE_FRAMES", "1"))
+
+
+def start():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACE_FRAMES)
+
+def stop():
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def rss_mb() -> float:
+    """Current RSS from /proc; falls back to the peak RSS where /proc is not available."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _module_of(filename: str, by_file: dict[str, str]) -> str:
+    if filename in by_file:
+        return by_file[filename].split(".")[0]
+    parts = filename.replace("\\", "/").split("/")
+    for marker in ("site-packages", "dist-packages"):
+        if marker in parts:
+            i = parts.index(marker)
+            if i + 1 < len(parts):
+                return parts[i + 1].removesuffix(".py")
+    return os.path.basename(filename).removesuffix(".py") or filename
+
+def top_modules(limit: int = 10) -> list[tuple[str, int, int]]:
+    """[(module, bytes, blocks)] largest first. Requires tracing to be on."""
+    if not tracemalloc.is_tracing():
+        return []
+    by_file = {}
+    for name, mod in list(sys.modules.items()):
+        f = getattr(mod, "__file__", None)
+        if f:
+            by_file[os.path.abspath(f)] = name
+    snap = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    agg: dict[str, list[int]] = {}
+    for st in snap.statistics("filename"):
+        mod = _module_of(os.path.abspath(st.traceback[0].filename), by_file)
+        a = agg.setdefault(mod, [0, 0])
+        a[0] += st.size
+        a[1] += st.count
+    return sorted(((m, b, n) for m, (b, n) in agg.items()), key=lambda t: t[1], reverse=True)[:limit]
+
+def report(limit: int = 10, budget_mb: int = 0) -> str:
+    rss = rss_mb()
+    head = f"RSS {rss:.1f} MiB"
+    if budget_mb:
+        head += f" / budget {budget_mb} MiB" + (" ⚠️ OVER" if rss > budget_mb else "")
+    if not tracemalloc.is_tracing():
+        return head + "\n(tracemalloc off)"
+    cur, peak = tracemalloc.get_traced_memory()
+    lines = [head, f"traced {cur / 2**20:.1f} MiB (peak {peak / 2**20:.1f} MiB)"]
+    for mod, size, count in top_modules(limit):
+        lines.append(f"{size / 2**20:8.2f} MiB  {count:8d} blocks  {mod}")
+    return "\n".join(lines)
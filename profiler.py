@@ -0,0 +1,159 @@
+# profiler.py
+"""
+On-demand CPU profiling for /profile.
+
+  deterministic  cProfile on the event-loop thread for the window, plus one
+                 cProfile per sheets_client call that runs in a to_thread
+                 worker meanwhile (see call()); merged with pstats.
+  sampling       a daemon thread reads sys._current_frames() every interval
+                 and counts which functions are on each thread's stack.
+                 Cheap enough to leave on (PROFILE_SAMPLER=1); /profile then
+                 reports the samples taken during its window.
+
+Stdlib only. On Python 3.12+ cProfile hooks sys.monitoring, which covers all
+threads at once: the loop profile then already includes the workers and
+call() runs unprofiled. With SHEETS_WORKER=1 the Sheets calls run in another
+process and are not covered.
+"""
+import collections, cProfile, io, os, pstats, sys, threading
+
+SAMPLE_INTERVAL_S = float(os.getenv("PROFILE_SAMPLE_MS", "10")) / 1000
+
+_lock = threading.Lock()
+_active = False                           # deterministic window open
+_loop_prof: cProfile.Profile | None = None
+_thread_profs: list[cProfile.Profile] = []
+
+
+# ---------- deterministic ----------
+
+def start():
+    """Begin profiling the calling thread (the event loop) and every call() made until stop()."""
+    global _active, _loop_prof
+    with _lock:
+        if _active:
+            raise RuntimeError("a profile is already running")
+        _thread_profs.clear()
+        _loop_prof = cProfile.Profile()
+        _active = True
+    _loop_prof.enable()
+
+def call(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs); profiled while a window is open (for to_thread workers)."""
+    if not _active:
+        return fn(*args, **kwargs)
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+    except ValueError:  # 3.12+: the loop profiler is already process-wide
+        return fn(*args, **kwargs)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        prof.disable()
+        with _lock:
+            if _active:
+                _thread_profs.append(prof)
+
+def stop(limit: int = 40) -> str:
+    """End the window; pstats text of loop + worker-thread profiles, by cumulative time."""
+    global _active, _loop_prof
+    with _lock:
+        prof, _loop_prof = _loop_prof, None
+        threads = list(_thread_profs)
+        _thread_profs.clear()
+        _active = False
+    if prof is None:
+        return "no profile running"
+    prof.disable()
+    out = io.StringIO()
+    stats = pstats.Stats(prof, stream=out)
+    for p in threads:
+        stats.add(p)
+    out.write(f"event loop + {len(threads)} sheets_client call(s) in worker threads\n\n")
+    stats.sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+# ---------- sampling ----------
+
+def _func_key(code) -> str:
+    return f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+
+class Sampler:
+    def __init__(self, interval_s: float = SAMPLE_INTERVAL_S):
+        self.interval_s = interval_s
+        self.samples = 0
+        self.cum: collections.Counter = collections.Counter()   # on the stack anywhere
+        self.own: collections.Counter = collections.Counter()   # top of the stack
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            frames = sys._current_frames()
+            with _lock:
+                for tid, frame in frames.items():
+                    if tid == me:
+                        continue
+                    self.samples += 1
+                    self.own[_func_key(frame.f_code)] += 1
+                    seen = set()
+                    while frame is not None:
+                        key = _func_key(frame.f_code)
+                        if key not in seen:
+                            seen.add(key)
+                            self.cum[key] += 1
+                        frame = frame.f_back
+            del frames
+
+    def snapshot(self) -> tuple[int, collections.Counter, collections.Counter]:
+        with _lock:
+            return self.samples, self.cum.copy(), self.own.copy()
+
+def format_samples(since: tuple, now: tuple, seconds: float, limit: int = 40) -> str:
+    """Report the samples taken between two Sampler.snapshot() calls."""
+    n = now[0] - since[0]
+    cum, own = now[1] - since[1], now[2] - since[2]
+    lines = [f"{n} thread samples over {seconds:.0f}s (every {SAMPLE_INTERVAL_S * 1000:.0f}ms, all threads)",
+             "", f"{'cum%':>6} {'self%':>6}  function"]
+    for key, c in cum.most_common(limit):
+        lines.append(f"{100 * c / max(n, 1):6.1f} {100 * own.get(key, 0) / max(n, 1):6.1f}  {key}")
+    return "\n".join(lines) + "\n"
+
+_sampler: Sampler | None = None
+_sampler_users = 0   # open /profile windows, plus one for PROFILE_SAMPLER=1
+
+def acquire_sampler() -> Sampler:
+    """The process-wide sampler, started on first use; pair with release_sampler()."""
+    global _sampler, _sampler_users
+    with _lock:
+        if _sampler is None:
+            _sampler = Sampler()
+            _sampler.start()
+        _sampler_users += 1
+        return _sampler
+
+def release_sampler():
+    """Stops the sampler once its last user is done, so overlapping windows keep their samples."""
+    global _sampler, _sampler_users
+    with _lock:
+        _sampler_users = max(0, _sampler_users - 1)
+        smp = _sampler if _sampler_users == 0 else None
+        if smp is not None:
+            _sampler = None
+    if smp is not None:
+        smp.stop()  # outside the lock: the sampler thread takes it while sampling
@@ -0,0 +1,203 @@
+# rules.py
+"""
+Recurring personal unavailability ("I can never do Thursdays").
+
+A rule is one small record instead of one names-cell write per date:
+  weekday      0-6 or None (None = every day in the span)
+  start, end   ISO dates or None (open-ended)
+  every_weeks  1 = every week; N = every N-th week counted from start
+  skip         ISO dates the user marked /can despite the rule
+  written      ISO dates the daily refresh wrote the name for (record_written),
+               so removing the rule takes out exactly those names
+
+Rules are evaluated lazily: sheets_client overlays them on get_schedule(),
+get_next_raid_days() and is_today_raid_day(). Only the daily refresh writes
+them into the names cells (in its one batched write).
+
+Stored in data/rules.json. The file is re-read when its mtime changes, so the
+Sheets worker process (SHEETS_WORKER=1) sees rules added by the bot process.
+"""
+import os, json, threading
+from datetime import date, datetime, timedelta
+
+DATA_DIR   = os.getenv("BOT_DATA_DIR", "data")
+RULES_PATH = os.path.join(DATA_DIR, "rules.json")
+
+_lock = threading.Lock()
+_rules: list[dict] = []
+_mtime: float | None = None
+
+
+def _load() -> list[dict]:
+    """Current rules; reloads after another process rewrote the file."""
+    global _rules, _mtime
+    try:
+        mtime = os.stat(RULES_PATH).st_mtime
+    except OSError:
+        mtime = None
+    with _lock:
+        if mtime != _mtime:
+            try:
+                with open(RULES_PATH, encoding="utf-8") as f:
+                    _rules = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                _rules = []
+            _mtime = mtime
+        return _rules
+
+def _save(rules: list[dict]):
+    global _rules, _mtime
+    os.makedirs(DATA_DIR, exist_ok=True)
+    tmp = RULES_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(rules, f, ensure_ascii=False)
+    os.replace(tmp, RULES_PATH)
+    _rules, _mtime = rules, os.stat(RULES_PATH).st_mtime
+
+def _matches(rule: dict, d: date) -> bool:
+    iso = d.isoformat()
+    if rule["start"] and iso < rule["start"]:
+        return False
+    if rule["end"] and iso > rule["end"]:
+        return False
+    if rule["weekday"] is not None and d.weekday() != rule["weekday"]:
+        return False
+    if rule["every_weeks"] > 1 and ((d - date.fromisoformat(rule["start"])).days // 7) % rule["every_weeks"]:
+        return False
+    return iso not in rule["skip"]
+
+
+def add_rule(user: str, weekday: int | None = None, start: date | None = None,
+             end: date | None = None, every_weeks: int = 1) -> dict:
+    """Store a rule. every_weeks > 1 counts from start (default: the next matching day)."""
+    if weekday is None and start is None:
+        raise ValueError("a rule needs a weekday or a start date")
+    if every_weeks > 1:
+        if weekday is None:
+            raise ValueError("every N weeks needs a weekday")
+        if start is None:
+            start = date.today()
+        start += timedelta(days=(weekday - start.weekday()) % 7)  # anchor on the weekday itself
+    if start and end and end < start:
+        raise ValueError("end is before start")
+    rules = [dict(r) for r in _load()]
+    rule = {
+        "id": max((r["id"] for r in rules), default=0) + 1,
+        "user": user,
+        "weekday": weekday,
+        "start": start.isoformat() if start else None,
+        "end": end.isoformat() if end else None,
+        "every_weeks": max(1, every_weeks),
+        "skip": [],
+        "written": [],
+    }
+    rules.append(rule)
+    _save(rules)
+    return rule
+
+def remove_rule(user: str, rule_id: int) -> bool:
+    rules = _load()
+    keep = [r for r in rules if not (r["id"] == rule_id and r["user"].lower() == user.lower())]
+    if len(keep) == len(rules):
+        return False
+    _save(keep)
+    return True
+
+def record_written(pairs: list[tuple[str, str]]) -> int:
+    """
+    Remember which (dd.mm.yyyy, user) names the refresh wrote, on every rule of
+    that user covering the date. Past dates are dropped. Returns dates added.
+    """
+    rules = [dict(r, written=list(r.get("written", []))) for r in _load()]
+    today = date.today().isoformat()
+    added = 0
+    for ds, user in pairs:
+        d = datetime.strptime(ds, "%d.%m.%Y").date()
+        for r in rules:
+            if r["user"].lower() == user.lower() and _matches(r, d) and d.isoformat() not in r["written"]:
+                r["written"].append(d.isoformat())
+                added += 1
+    pruned = False
+    for r in rules:
+        keep = [w for w in r["written"] if w >= today]
+        pruned |= len(keep) != len(r["written"])
+        r["written"] = keep
+    if added or pruned:
+        _save(rules)
+    return added
+
+def written_dates(rule: dict, remaining: list[dict]) -> list[str]:
+    """dd.mm.yyyy dates whose name only `rule` put there: not covered by the user's remaining rules."""
+    out = []
+    for iso in rule.get("written", []):
+        d = date.fromisoformat(iso)
+        if not any(_matches(r, d) for r in remaining if r["user"].lower() == rule["user"].lower()):
+            out.append(d.strftime("%d.%m.%Y"))
+    return out
+
+def rules_for(user: str) -> list[dict]:
+    return [r for r in _load() if r["user"].lower() == user.lower()]
+
+def set_override(user: str, d: date, available: bool) -> bool:
+    """
+    /can on a date a rule covers adds it to that rule's skip list; /cant removes
+    it again. Either way the name on that date is the user's own from now on, so
+    it no longer counts as written by the rule. Returns True if a rule was changed.
+    """
+    rules = [dict(r, skip=list(r["skip"]), written=list(r.get("written", []))) for r in _load()]
+    iso, changed = d.isoformat(), False
+    for r in rules:
+        if r["user"].lower() != user.lower():
+            continue
+        if iso in r["written"]:
+            r["written"].remove(iso)
+            changed = True
+        if available and iso not in r["skip"] and _matches(r, d):
+            r["skip"].append(iso)
+            changed = True
+        elif not available and iso in r["skip"]:
+            r["skip"].remove(iso)
+            changed = True
+    if changed:
+        # skips in the past are dead weight
+        today = date.today().isoformat()
+        for r in rules:
+            r["skip"] = [s for s in r["skip"] if s >= today]
+        _save(rules)
+    return changed
+
+def active() -> list[dict]:
+    return _load()
+
+def names_on(d: date, rules: list[dict] | None = None) -> list[str]:
+    """Users whose rules make them unavailable on d (pass active() when checking many dates)."""
+    out: list[str] = []
+    for r in (_load() if rules is None else rules):
+        if _matches(r, d) and r["user"].lower() not in (n.lower() for n in out):
+            out.append(r["user"])
+    return out
+
+def overlay(d: date, flag: str, names: list[str], rules: list[dict] | None = None) -> tuple[str, list[str]]:
+    """Sheet (flag, names) for d with the rule users added; any can't means ✖."""
+    if not (_load() if rules is None else rules):
+        return flag, names
+    extra = [n for n in names_on(d, rules) if n.lower() not in {x.lower() for x in names}]
+    if not extra:
+        return flag, names
+    return "✖", names + extra
+
+def describe(rule: dict) -> str:
+    days = ["Mondays", "Tuesdays", "Wednesdays", "Thursdays", "Fridays", "Saturdays", "Sundays"]
+    if rule["weekday"] is None:
+        text = "every day"
+    elif rule["every_weeks"] > 1:
+        text = f"every {rule['every_weeks']} weeks on {days[rule['weekday']][:-1]}"
+    else:
+        text = days[rule["weekday"]]
+    if rule["start"]:
+        text += f" from {date.fromisoformat(rule['start']):%d.%m.%Y}"
+    if rule["end"]:
+        text += f" until {date.fromisoformat(rule['end']):%d.%m.%Y}"
+    if rule["skip"]:
+        text += f" (except {len(rule['skip'])} date(s))"
+    return text
@@ -1,15 +1,27 @@
 # sheets_client.py
-import os, json
+import os, json, threading, time, uuid
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
-from datetime import datetime
+from googleapiclient.errors import HttpError
+from google_auth_httplib2 import AuthorizedHttp, Request as AuthRequest
+import httplib2
+from datetime import datetime, date, timezone
 import calendar
 from zoneinfo import ZoneInfo
+import attendance
+import rules
+import tracing
 
 SPREADSHEET_ID = "1lCXsPkRyTQff15z7RD7bRV_l4R0ciU1U5oalMD9XOdc"
 SCOPES         = ["https://www.googleapis.com/auth/spreadsheets"]
 META_KEY_ROW = 3
 
+SHEETS_BACKEND  = os.getenv("SHEETS_BACKEND", "google")          # "google" | "local" (in-memory stand-in)
+# "stamp" (C3:D3) | "drive" (file version) | "auto" = drive if the Drive API answers, else the stamp
+REVISION_SOURCE = os.getenv("SHEETS_REVISION_SOURCE", "stamp")
+if REVISION_SOURCE != "stamp":
+    SCOPES.append("https://www.googleapis.com/auth/drive.metadata.readonly")
+
 def _build_creds():
     """
     Prefer GOOGLE_SA_JSON (the JSON content) if present.
@@ -28,10 +40,108 @@ def _build_creds():
             "No Google credentials found. Set GOOGLE_SA_JSON or GOOGLE_APPLICATION_CREDENTIALS."
         )
 
-_creds  = _build_creds()
-_svc    = build("sheets", "v4", credentials=_creds)
+class _TracedHttp(AuthorizedHttp):
+    """One tracing span per HTTP round trip (token refreshes included)."""
+    def request(self, uri, method="GET", *args, **kwargs):
+        with tracing.span(f"sheets.http {method}", path=uri.split("?")[0].rsplit("/v4/", 1)[-1][:120]):
+            return super().request(uri, method, *args, **kwargs)
+
+if SHEETS_BACKEND == "local":
+    import sheets_local
+    _creds  = None
+    _svc    = sheets_local.LocalService(latency_ms=float(os.getenv("SHEETS_LOCAL_LATENCY_MS", "0")))
+    _drive  = None  # the stand-in exposes drive_version() itself
+else:
+    _creds  = _build_creds()
+    _svc    = build("sheets", "v4", http=_TracedHttp(_creds, http=httplib2.Http()))
+    _drive  = (build("drive", "v3", http=_TracedHttp(_creds, http=httplib2.Http()))
+               if REVISION_SOURCE != "stamp" else None)
 _values = _svc.spreadsheets().values()
 
+# ===== Proactive token refresh =====
+# Credentials refresh lazily inside whichever request runs after expiry. The token
+# manager refreshes well before that on a background thread, so google-auth always
+# sees a valid token and no command pays for the token endpoint.
+
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN_S", "600"))  # seconds before expiry
+
+class TokenManager:
+    def __init__(self, creds, margin_s: int = TOKEN_REFRESH_MARGIN):
+        self.creds = creds
+        self.margin_s = margin_s
+        self.latencies_ms: list[float] = []  # last 50 refreshes
+        self.on_refresh = None               # callback(token, expiry_iso), e.g. push to the worker process
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _seconds_left(self) -> float:
+        if not self.creds.token or self.creds.expiry is None:
+            return 0.0
+        now = datetime.now(timezone.utc).replace(tzinfo=None)  # google-auth uses naive UTC
+        return (self.creds.expiry - now).total_seconds()
+
+    def refresh_now(self):
+        t0 = time.perf_counter()
+        with tracing.span("token.refresh", root=True):
+            self.creds.refresh(AuthRequest(httplib2.Http()))
+        ms = (time.perf_counter() - t0) * 1000
+        self.latencies_ms = (self.latencies_ms + [ms])[-50:]
+        print(f"[token] refreshed in {ms:.0f} ms, valid until {self.creds.expiry:%H:%M:%S} UTC")
+        if self.on_refresh:
+            try:
+                self.on_refresh(self.creds.token, self.creds.expiry.isoformat())
+            except Exception as e:
+                print(f"[token] on_refresh failed: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = self._seconds_left() - self.margin_s
+            if wait > 0:
+                self._stop.wait(min(wait, 300))
+                continue
+            try:
+                self.refresh_now()
+            except Exception as e:
+                print(f"[token] refresh failed, retrying in 30s: {e}")
+                self._stop.wait(30)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="token-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+_token_manager = TokenManager(_creds) if _creds is not None else None
+
+def start_token_refresh(on_refresh=None) -> bool:
+    """Start background refresh (no-op on the local stand-in). Returns True if running."""
+    if _token_manager is None:
+        return False
+    _token_manager.on_refresh = on_refresh
+    _token_manager.start()
+    return True
+
+def adopt_token(token: str, expiry_iso: str):
+    """Take over a token minted elsewhere (the bot process pushes it to the Sheets worker)."""
+    if _creds is None:
+        return
+    _creds.token = token
+    _creds.expiry = datetime.fromisoformat(expiry_iso)
+
+def token_stats() -> dict:
+    if _token_manager is None:
+        return {}
+    lat = sorted(_token_manager.latencies_ms)
+    return {
+        "refreshes": len(lat),
+        "p50_ms": lat[len(lat) // 2] if lat else 0.0,
+        "max_ms": lat[-1] if lat else 0.0,
+        "seconds_left": round(_token_manager._seconds_left()),
+    }
+
 TAB = "'Schedule'"     # visible schedule tab
 START_ROW = 6
 MONTH_COLS = [
@@ -75,13 +185,264 @@ def record_cant(user_id: int, user_tag: str, date_str: str):
         insertDataOption="INSERT_ROWS",
         body={"values":[[ts, str(user_id), user_tag, date_str]]}
     ).execute()
+    _write_ranges([])  # stamp only
+
+# ===== Revision stamp + block cache =====
+# Every write by the bot puts a fresh unique token into C3:D3 (key='Revision') in
+# the same batchUpdate as the data. Caches are tagged with the revision they were
+# read at; one tiny cell read tells whether they are still valid. The stamp cannot
+# see hand edits in the browser, so with it the caches are also dropped every
+# SHEETS_CACHE_MAX_AGE seconds: a full re-read per minute whether or not anything
+# changed is the price of seeing hand edits (/refresh drops them at once).
+# SHEETS_REVISION_SOURCE=drive (or auto) probes the Drive file version instead,
+# which every edit moves, so caches live until something really changed. That
+# version is file-wide: the bot counts its own writes as "version+n" and only an
+# exact match keeps the caches; anything else, including the leader lease
+# (refused with this source), drops them. Names cells are re-read right before
+# every read-modify-write either way (_live_rows).
+
+REV_RANGE     = f"C{META_KEY_ROW}:D{META_KEY_ROW}"
+FRESHNESS_TTL = float(os.getenv("SHEETS_FRESHNESS_TTL", "2"))  # seconds a probe is trusted (~one command)
+CACHE_MAX_AGE = float(os.getenv("SHEETS_CACHE_MAX_AGE", "60"))  # stamp source: hand edits show up after this
+
+_cache_lock    = threading.RLock()
+_cache_rev: str | None = None   # revision the caches were read at ("version+own writes" for Drive)
+_cache_checked = 0.0            # monotonic time of the last probe
+_cache_born    = 0.0            # monotonic time the caches were last emptied
+_block_cache: dict[str, list[list[str]]] = {}  # c1 -> rows [Weekday, Date, Raid?, Names]
+_next7_cache: int | None = None                # dashboard message id (meta row)
+
+def _read_revision() -> str:
+    global REVISION_SOURCE
+    if REVISION_SOURCE != "stamp":
+        if _drive is None:
+            return _svc.drive_version()
+        try:
+            return str(_drive.files().get(fileId=SPREADSHEET_ID, fields="version").execute()["version"])
+        except HttpError as e:
+            if REVISION_SOURCE != "auto" or e.resp.status not in (403, 404):
+                raise
+            print(f"[sheets] Drive file version unavailable ({e.resp.status}); using the revision stamp, "
+                  f"hand edits show up within {CACHE_MAX_AGE:.0f}s")
+            REVISION_SOURCE = "stamp"
+    vals = _values.get(spreadsheetId=SPREADSHEET_ID, range=_meta_a1(REV_RANGE)).execute().get("values", [])
+    if vals and len(vals[0]) >= 2 and vals[0][0] == "Revision":
+        return vals[0][1]
+    return "0"
+
+def _drop_caches():
+    global _next7_cache, _cache_born
+    _block_cache.clear()
+    _rem_invalidate()
+    _next7_cache = None
+    _cache_born = time.monotonic()
+
+def invalidate_caches():
+    """Forget everything cached; the next read goes to the sheet."""
+    global _cache_rev, _cache_checked
+    with _cache_lock:
+        _drop_caches()
+        _cache_rev = None
+        _cache_checked = 0.0
+
+def ensure_fresh(force: bool = False) -> bool:
+    """
+    Freshness protocol: at most one revision read per FRESHNESS_TTL.
+    Drops the caches if the revision moved, or (stamp source) once they are older
+    than CACHE_MAX_AGE. Returns True if the caches were kept.
+    """
+    global _cache_rev, _cache_checked
+    now = time.monotonic()
+    with _cache_lock:
+        if not force and _cache_rev is not None and now - _cache_checked < FRESHNESS_TTL:
+            return True
+    rev = _read_revision()
+    with _cache_lock:
+        kept = rev == (_cache_rev if REVISION_SOURCE == "stamp" else _expected_version(_cache_rev))
+        if kept and REVISION_SOURCE == "stamp" and now - _cache_born > CACHE_MAX_AGE:
+            kept = False  # may hide hand edits the stamp cannot see
+        if not kept:
+            _drop_caches()
+            _cache_rev = rev
+        _cache_checked = now
+        return kept
+
+def _expected_version(rev: str | None) -> str | None:
+    """Drive version the file has if only our own writes happened since "version+n" was read."""
+    base, _, n = (rev or "").partition("+")
+    try:
+        return str(int(base) + int(n or 0))
+    except ValueError:
+        return None
+
+def export_state() -> dict:
+    """Everything currently cached, for snapshot.save (never reads the sheet)."""
+    rem = _rem_cache
+    with _cache_lock:
+        return {
+            "rev": _cache_rev or "",
+            "blocks": {c1: [list(r) for r in rows] for c1, rows in _block_cache.items()},
+            "reminders": [list(r) for r in rem[0]] if rem is not None else None,
+            "next7_id": _next7_cache,
+        }
+
+def import_state(state: dict):
+    """
+    Seed the caches from a snapshot taken at revision state['rev']. They count as
+    fresh for one FRESHNESS_TTL; after that the normal probe revalidates them.
+    """
+    global _cache_rev, _cache_checked, _cache_born, _next7_cache, _rem_cache, _rem_ready
+    with _cache_lock:
+        _block_cache.clear()
+        _block_cache.update({c1: [list(r) for r in rows] for c1, rows in state["blocks"].items()})
+        rem = state.get("reminders")
+        if rem is not None:
+            _rem_cache = (rem, {r[0]: i for i, r in enumerate(rem) if r[0]})
+            _rem_ready = True  # the tab existed when the snapshot was taken
+        else:
+            _rem_invalidate()
+        _next7_cache = state.get("next7_id")
+        _cache_rev = state["rev"] or None
+        _cache_checked = _cache_born = time.monotonic()
+
+def _reserve_stamp() -> str:
+    """
+    A new revision token. Random rather than a counter: another process or host
+    writing at the same time never produces the same stamp, so each side sees
+    the other's write as a revision change. With the Drive source the write is
+    counted instead: it must move the file version by exactly one.
+    """
+    global _cache_rev
+    stamp = uuid.uuid4().hex[:16]
+    with _cache_lock:
+        if REVISION_SOURCE == "stamp":
+            _cache_rev = stamp
+        elif _cache_rev is not None:
+            base, _, n = _cache_rev.partition("+")
+            _cache_rev = f"{base}+{int(n or 0) + 1}"
+        return stamp
+
+def _commit_revision():
+    """After a successful write: the caches (already patched) belong to the new revision."""
+    global _cache_checked
+    with _cache_lock:
+        _cache_checked = time.monotonic()
+
+def _col_num(col: str) -> int:
+    n = 0
+    for ch in col:
+        n = n * 26 + (ord(ch) - ord('A') + 1)
+    return n
+
+def _cache_patch(range_a1: str, values: list[list]):
+    """Apply a write to the cached block rows so our own writes never force a re-read."""
+    if "!" in range_a1 and range_a1.split("!")[0].strip("'") != TAB.strip("'"):
+        return  # other tabs (Reminders) share A1 coordinates with the blocks
+    cell = range_a1.split("!")[-1].split(":")[0]
+    col_s = "".join(ch for ch in cell if ch.isalpha())
+    row0 = int("".join(ch for ch in cell if ch.isdigit()) or 0)
+    col0 = _col_num(col_s)
+    with _cache_lock:
+        for i, vals in enumerate(values):
+            for j, v in enumerate(vals):
+                r, c = row0 + i, col0 + j
+                if not (START_ROW <= r <= START_ROW + 30):
+                    continue
+                for (c1, _c2, c3) in MONTH_COLS:
+                    base = _col_num(c1)
+                    if not (base <= c <= _col_num(c3) + 1):
+                        continue
+                    rows = _block_cache.get(c1)
+                    if rows is None:
+                        break
+                    while len(rows) <= r - START_ROW:
+                        rows.append([])
+                    row = rows[r - START_ROW]
+                    while len(row) < 4:
+                        row.append("")
+                    row[c - base] = "" if v is None else str(v)
+                    break
+
+def _write_ranges(data: list[tuple[str, list[list]]]):
+    """Write several ranges plus the revision stamp in ONE values.batchUpdate."""
+    stamp = _reserve_stamp()
+    body = [{"range": rng, "values": vals} for rng, vals in data]
+    body.append({"range": _meta_a1(REV_RANGE), "values": [["Revision", stamp]]})
+    try:
+        _values.batchUpdate(
+            spreadsheetId=SPREADSHEET_ID,
+            body={"valueInputOption": "USER_ENTERED", "data": body}
+        ).execute()
+    except Exception:
+        invalidate_caches()
+        raise
+    for rng, vals in data:
+        _cache_patch(rng, vals)
+    _commit_revision()
+
+def _bump_revision():
+    """Stamp-only write, for bulk writers that went through _values.update directly."""
+    invalidate_caches()
+    ensure_fresh(force=True)
+    _write_ranges([])
+
+def _all_blocks() -> list[list[list[str]]]:
+    """Rows [Weekday, Date, Raid?, Names] of every block; missing blocks fetched with one batchGet."""
+    ensure_fresh()
+    with _cache_lock:
+        rev = _cache_rev
+        missing = [cols for cols in MONTH_COLS if cols[0] not in _block_cache]
+    if missing:
+        ranges = [f"{TAB}!{c1}{START_ROW}:{_next_col(c3)}{START_ROW+30}" for (c1, _c2, c3) in missing]
+        resp = _values.batchGet(spreadsheetId=SPREADSHEET_ID, ranges=ranges).execute()
+        fetched = [vr.get("values", []) or [] for vr in resp.get("valueRanges", [])]
+        with _cache_lock:
+            if _cache_rev == rev:
+                for (c1, _c2, _c3), rows in zip(missing, fetched):
+                    _block_cache[c1] = [list(r) for r in rows]
+            got = dict(zip((cols[0] for cols in missing), fetched))
+    else:
+        got = {}
+    with _cache_lock:
+        return [[list(r) for r in (got.get(c1) if c1 in got else _block_cache.get(c1, []))]
+                for (c1, _c2, _c3) in MONTH_COLS]
+
+def _find_date(date_str: str) -> tuple[tuple[str, str, str], int, list[str]] | None:
+    """(block cols, row index in block, row) for a dd.mm.yyyy date, or None."""
+    for cols, rows in zip(MONTH_COLS, _all_blocks()):
+        for i, r in enumerate(rows):
+            if len(r) >= 2 and r[1] and r[1].strip() == date_str:
+                return cols, i, r
+    return None
+
+def _live_rows(date_strs: list[str]) -> dict[str, tuple[tuple[str, str, str], int, list[str]]]:
+    """
+    Like _find_date for several dates, but the rows themselves are read from the
+    sheet (one batchGet) and patched into the cache: read-modify-writes must never
+    build on a cached cell an officer has edited by hand since. If a row no longer
+    holds its date, the layout moved: retry once with cold caches.
+    """
+    for attempt in (0, 1):
+        hits = {d: hit for d in dict.fromkeys(date_strs) if (hit := _find_date(d))}
+        if not hits:
+            return {}
+        ranges = [f"{TAB}!{c1}{START_ROW + i}:{_next_col(c3)}{START_ROW + i}"
+                  for (c1, _c2, c3), i, _row in hits.values()]
+        resp = _values.batchGet(spreadsheetId=SPREADSHEET_ID, ranges=ranges).execute()
+        out = {}
+        for (date_str, (cols, i, _row)), rng, vr in zip(hits.items(), ranges, resp.get("valueRanges", [])):
+            row = ((vr.get("values") or [[]])[0] + [""] * 4)[:4]
+            _cache_patch(rng, [row])
+            if row[1].strip() == date_str:
+                out[date_str] = (cols, i, row)
+        if len(out) == len(hits) or attempt:
+            return out
+        invalidate_caches()
+    return {}
 
 def _read_month_block(cols: tuple[str,str,str]):
     """Read current values from a month block; return list of rows and mapping date->(row_index, current_flag)."""
-    c1, c2, c3 = cols
-    rng = f"{TAB}!{c1}{START_ROW}:{c3}{START_ROW+30}"
-    resp = _values.get(spreadsheetId=SPREADSHEET_ID, range=rng).execute()
-    rows = resp.get("values", []) or []
+    rows = _all_blocks()[MONTH_COLS.index(cols)]
     index_by_date = {}
     for i, r in enumerate(rows):
         if len(r) >= 2 and r[1]:
@@ -92,6 +453,8 @@ def _read_month_block(cols: tuple[str,str,str]):
 
 _PLANNED_DAYS = {0, 2, 3}  # Mo=0, Mi=2, Do=3
 
+_names_lock = threading.RLock()  # one names/Raid? read-modify-write at a time in this process
+
 def set_raid_date_in_visible_table(date_str: str, value: str, *, only_on_planned: bool = True) -> bool:
     """
     Sets the Raid? field to '✔' or '✖'.
@@ -103,40 +466,24 @@ def set_raid_date_in_visible_table(date_str: str, value: str, *, only_on_planned
         if dt.weekday() not in _PLANNED_DAYS:
             return False  # leave ✖ as-is
 
-    # --- your existing code that finds the row and writes the value ---
-    for (c1, c2, c3) in MONTH_COLS:
-        rows, idx = _read_month_block((c1, c2, c3))
-        hit = idx.get(date_str)
-        if not hit:
-            continue
-        row_i, _ = hit
-        target_row = START_ROW + row_i
-        _values.update(
-            spreadsheetId=SPREADSHEET_ID,
-            range=_a1(f"{c3}{target_row}"),
-            valueInputOption="USER_ENTERED",
-            body={"values": [[value]]},
-        ).execute()
-        return True
-    return False
+    hit = _find_date(date_str)
+    if not hit:
+        return False
+    (c1, c2, c3), row_i, _row = hit
+    _write_cell(f"{TAB}!{c3}{START_ROW + row_i}", value)
+    return True
 
 def toggle_raid_date_in_visible_table(date_str: str) -> str | None:
     """Flip ✔/✖ for date; returns new value or None if date not found."""
-    for (c1, c2, c3) in MONTH_COLS:
-        rows, idx = _read_month_block((c1,c2,c3))
-        hit = idx.get(date_str)
-        if hit:
-            row_i, cur = hit
-            new_val = "✖" if cur == "✔" else "✔"
-            target_row = START_ROW + row_i
-            _values.update(
-                spreadsheetId=SPREADSHEET_ID,
-                range=f"{TAB}!{c3}{target_row}",
-                valueInputOption="USER_ENTERED",
-                body={"values":[[new_val]]}
-            ).execute()
-            return new_val
-    return None
+    with _names_lock:
+        hit = _live_rows([date_str]).get(date_str)
+        if not hit:
+            return None
+        (c1, c2, c3), row_i, row = hit
+        cur = row[2].strip() if len(row) >= 3 and row[2] else ""
+        new_val = "✖" if cur == "✔" else "✔"
+        _write_cell(f"{TAB}!{c3}{START_ROW + row_i}", new_val)
+        return new_val
 
 def _write_month_default(year: int, month: int, start_day: int, cols: tuple[str,str,str]):
     """Overwrite one month block with defaults: Mon/Wed/Thu = ✔, else ✖, and clear Names."""
@@ -195,6 +542,7 @@ def rebuild_schedule(start_current_from_today: bool = True):
         m  = (m0 % 12) + 1
         start_day = (today.day if (idx == 0 and start_current_from_today) else 1)
         _write_month_default(y, m, start_day, cols)
+    _bump_revision()
 
 # ===== Daily refresh that preserves overrides ACROSS blocks =====
 
@@ -209,10 +557,7 @@ def _collect_overrides_all_blocks() -> dict[str, str]:
     regardless of which block the date is currently in.
     """
     overrides: dict[str, str] = {}
-    for (c1, c2, c3) in MONTH_COLS:
-        rng = f"{TAB}!{c1}{START_ROW}:{c3}{START_ROW+30}"
-        resp = _values.get(spreadsheetId=SPREADSHEET_ID, range=rng).execute()
-        rows = resp.get("values", []) or []
+    for rows in _all_blocks():
         for r in rows:
             if len(r) >= 3 and r[1]:
                 date_s = r[1].strip()
@@ -245,11 +590,7 @@ def _collect_flags_and_names() -> tuple[dict[str, str], dict[str, str]]:
     """Collect ✔/✖ and names from all blocks keyed by date string."""
     flags: dict[str, str] = {}
     names: dict[str, str] = {}
-    for (c1, c2, c3) in MONTH_COLS:
-        names_col = _next_col(c3)
-        rng = f"{TAB}!{c1}{START_ROW}:{names_col}{START_ROW+30}"
-        resp = _values.get(spreadsheetId=SPREADSHEET_ID, range=rng).execute()
-        rows = resp.get("values", []) or []
+    for rows in _all_blocks():
         for r in rows:
             if len(r) >= 2 and r[1]:
                 date_s = r[1].strip()
@@ -259,71 +600,82 @@ def _collect_flags_and_names() -> tuple[dict[str, str], dict[str, str]]:
                     names[date_s] = r[3].strip()
     return flags, names
 
-def refresh_schedule_preserve_overrides():
+def _archive_past_rows(today: datetime, flags_map: dict[str, str], names_map: dict[str, str]):
+    """Hand every date before today to the local attendance archive."""
+    past: list[tuple[str, str, list[str]]] = []
+    for date_s in set(flags_map) | set(names_map):
+        try:
+            dt = datetime.strptime(date_s, "%d.%m.%Y")
+        except ValueError:
+            continue
+        if dt.date() >= today.date():
+            continue
+        names = [p.strip() for p in names_map.get(date_s, "").split(",") if p.strip()]
+        past.append((date_s, flags_map.get(date_s, ""), names))
+    if past:
+        n = attendance.archive_rows(past)
+        if n:
+            print(f"[attendance] archived {n} past dates")
+
+def refresh_schedule_preserve_overrides() -> list[tuple[str, str]]:
     """
     Rebuilds the 3 blocks from *today*, preserving both ✔/✖ and the Names column
-    by matching on the same 'dd.mm.yyyy' dates across blocks.
+    by matching on the same 'dd.mm.yyyy' dates across blocks. Recurring rules
+    (rules.py) are written into the names cells here. Everything goes out in
+    ONE batchUpdate. Returns the (date, user) names added for rules, for
+    rules.record_written.
     """
-    today = datetime.today()
-    flags_map, names_map = _collect_flags_and_names()
-    desired = _desired_window(today)  # [(Weekday, dd.mm.yyyy, default_flag)]
-
-    # Which (year,month) each block represents now
-    month_tags: list[tuple[int,int]] = []
-    for idx in range(NUM_BLOCKS):
-        m0 = today.month - 1 + idx
-        y  = today.year + (m0 // 12)
-        m  = (m0 % 12) + 1
-        month_tags.append((y, m))
-
-    # Partition desired rows per visual block
-    per_block: list[list[tuple[str,str,str]]] = [[] for _ in range(NUM_BLOCKS)]
-    for wd, date_s, default_flag in desired:
-        dt = datetime.strptime(date_s, "%d.%m.%Y")
-        ym = (dt.year, dt.month)
-        blk = month_tags.index(ym) if ym in month_tags else (NUM_BLOCKS - 1)
-        per_block[blk].append((wd, date_s, default_flag))
-
-    # Write each block with preserved flags & names
-    for blk_idx, (c1, c2, c3) in enumerate(MONTH_COLS):
-        y, m = month_tags[blk_idx]
-        names_col = _next_col(c3)
-
-        # Header
-        hdr = datetime(y, m, 1).strftime("%B %Y")
-        _values.update(
-            spreadsheetId=SPREADSHEET_ID,
-            range=f"{TAB}!{c1}4",
-            valueInputOption="USER_ENTERED",
-            body={"values": [[hdr]]}
-        ).execute()
-
-        desired_rows = per_block[blk_idx]
-        new_block: list[list[str]] = []
-        for wd, date_s, default_flag in desired_rows:
-            flag  = flags_map.get(date_s, default_flag)
-            names = names_map.get(date_s, "")
-            new_block.append([wd, date_s, flag, names])
-
-        # Write rows (Weekday, Date, Raid?, Names)
-        if new_block:
-            _values.update(
-                spreadsheetId=SPREADSHEET_ID,
-                range=f"{TAB}!{c1}{START_ROW}:{names_col}{START_ROW+len(new_block)-1}",
-                valueInputOption="USER_ENTERED",
-                body={"values": new_block}
-            ).execute()
-
-        # Clear leftovers (4 columns)
-        leftover = 31 - len(new_block)
-        if leftover > 0:
-            empties = [["","","",""]]*leftover
-            _values.update(
-                spreadsheetId=SPREADSHEET_ID,
-                range=f"{TAB}!{c1}{START_ROW+len(new_block)}:{names_col}{START_ROW+30}",
-                valueInputOption="USER_ENTERED",
-                body={"values": empties}
-            ).execute()
+    with _names_lock:  # the whole grid is rewritten from what we read
+        today = datetime.today()
+        invalidate_caches()  # about to overwrite everything: never trust a cache here
+        flags_map, names_map = _collect_flags_and_names()
+        desired = _desired_window(today)  # [(Weekday, dd.mm.yyyy, default_flag)]
+
+        # Archive dates that are about to roll off BEFORE overwriting them
+        _archive_past_rows(today, flags_map, names_map)
+
+        # Which (year,month) each block represents now
+        month_tags: list[tuple[int,int]] = []
+        for idx in range(NUM_BLOCKS):
+            m0 = today.month - 1 + idx
+            y  = today.year + (m0 // 12)
+            m  = (m0 % 12) + 1
+            month_tags.append((y, m))
+
+        # Partition desired rows per visual block
+        per_block: list[list[tuple[str,str,str]]] = [[] for _ in range(NUM_BLOCKS)]
+        for wd, date_s, default_flag in desired:
+            dt = datetime.strptime(date_s, "%d.%m.%Y")
+            ym = (dt.year, dt.month)
+            blk = month_tags.index(ym) if ym in month_tags else (NUM_BLOCKS - 1)
+            per_block[blk].append((wd, date_s, default_flag))
+
+        # Each block with preserved flags & names, plus rule users
+        active = rules.active()
+        data: list[tuple[str, list[list]]] = []
+        written: list[tuple[str, str]] = []
+        for blk_idx, (c1, c2, c3) in enumerate(MONTH_COLS):
+            y, m = month_tags[blk_idx]
+            names_col = _next_col(c3)
+
+            # Header
+            data.append((f"{TAB}!{c1}4", [[datetime(y, m, 1).strftime("%B %Y")]]))
+
+            desired_rows = per_block[blk_idx]
+            new_block: list[list[str]] = []
+            for wd, date_s, default_flag in desired_rows:
+                flag  = flags_map.get(date_s, default_flag)
+                names = [p.strip() for p in names_map.get(date_s, "").split(",") if p.strip()]
+                n_sheet = len(names)
+                flag, names = rules.overlay(datetime.strptime(date_s, "%d.%m.%Y").date(), flag, names, active)
+                written += [(date_s, n) for n in names[n_sheet:]]
+                new_block.append([wd, date_s, flag, ", ".join(names)])
+
+            # Rows (Weekday, Date, Raid?, Names), leftovers cleared (31 rows per block)
+            new_block += [["", "", "", ""]] * (31 - len(new_block))
+            data.append((f"{TAB}!{c1}{START_ROW}:{names_col}{START_ROW+30}", new_block))
+        _write_ranges(data)
+        return written
 
 # The name column is the column *after* the "Raid?" column in each block.
 # Works for A..Z, AA..AZ, BA.., etc.
@@ -341,51 +693,68 @@ def _next_col(col_letter: str) -> str:
     return "".join(reversed(out))
 
 
-def _read_cell(range_a1: str) -> str:
-    resp = _values.get(spreadsheetId=SPREADSHEET_ID, range=range_a1).execute()
-    vals = resp.get("values", [])
-    return (vals[0][0].strip() if vals and vals[0] else "")
-
 def _write_cell(range_a1: str, value: str):
-    _values.update(
-        spreadsheetId=SPREADSHEET_ID,
-        range=range_a1,
-        valueInputOption="USER_ENTERED",
-        body={"values": [[value]]}
-    ).execute()
+    _write_ranges([(range_a1, [[value]])])
+
+def apply_name_mutations(mutations: list[tuple[str, str, str]]) -> dict[str, tuple[str, str]]:
+    """
+    Apply [(op, dd.mm.yyyy, user_name)] with op 'add' | 'remove', in order, to the
+    names/Raid? grid and write every changed cell in ONE batchUpdate.
+      add    -> add name (case-insensitive set) and force ✖
+      remove -> drop name; ✔ if nobody is left, else keep ✖
+      unlist -> drop name, leave Raid? as it is (off days stay ✖)
+    Returns {date: (flag, joined_names)} for every date that exists in the grid.
+    Serialized in this process: callers (coalesced flushes, imports, the journal,
+    /rules remove) would otherwise overwrite each other's read-modify-write.
+    """
+    with _names_lock:
+        state: dict[str, list] = {}  # date -> [names_rng, raid_rng, items, flag, orig_names, orig_flag]
+        live = _live_rows([d for _op, d, _u in mutations])
+        for op, date_str, user_name in mutations:
+            if date_str not in state:
+                hit = live.get(date_str)
+                if not hit:
+                    continue
+                (c1, c2, c3), row_i, row = hit
+                target_row = START_ROW + row_i
+                current = row[3].strip() if len(row) >= 4 and row[3] else ""
+                flag = row[2].strip() if len(row) >= 3 and row[2] else ""
+                # maintain a comma-separated, trimmed, case-insensitive set
+                items = [p.strip() for p in current.split(",") if p.strip()] if current else []
+                state[date_str] = [f"{TAB}!{_next_col(c3)}{target_row}", f"{TAB}!{c3}{target_row}",
+                                   items, flag, ", ".join(items), flag]
+            st = state[date_str]
+            if op == "add":
+                if user_name.lower() not in [x.lower() for x in st[2]]:
+                    st[2].append(user_name)
+                st[3] = "✖"
+            else:
+                st[2] = [x for x in st[2] if x.lower() != user_name.lower()]
+                if op == "remove":
+                    st[3] = "✖" if st[2] else "✔"
+
+        writes: list[tuple[str, list[list]]] = []
+        out: dict[str, tuple[str, str]] = {}
+        for date_str, (names_rng, raid_rng, items, flag, orig_names, orig_flag) in state.items():
+            joined = ", ".join(items)
+            if joined != orig_names:
+                writes.append((names_rng, [[joined]]))
+            if flag != orig_flag:
+                writes.append((raid_rng, [[flag]]))
+            out[date_str] = (flag, joined)
+        if writes:
+            _write_ranges(writes)
+        return out
 
 def add_cant_user(date_str: str, user_name: str) -> tuple[bool, str]:
     """
     Add user_name to the “names” cell next to Raid? for the given date
     and set Raid? to ✖. Returns (True, joined_names) if date found, else (False, "").
     """
-    for (c1, c2, c3) in MONTH_COLS:
-        rows, idx = _read_month_block((c1, c2, c3))
-        hit = idx.get(date_str)
-        if not hit:
-            continue
-        row_i, _cur = hit
-        target_row = START_ROW + row_i
-
-        raid_col = c3
-        names_col = _next_col(c3)   # D / H / L
-
-        names_rng = f"{TAB}!{names_col}{target_row}"
-        current = _read_cell(names_rng)
-        # maintain a comma-separated, trimmed, case-insensitive set
-        existing = [p.strip() for p in current.split(",") if p.strip()] if current else []
-        # avoid duplicates (case-insensitive)
-        if user_name.lower() not in [x.lower() for x in existing]:
-            existing.append(user_name)
-
-        joined = ", ".join(existing)
-
-        # write names and force ✖
-        _write_cell(names_rng, joined)
-        _write_cell(f"{TAB}!{raid_col}{target_row}", "✖")
-
-        return True, joined
-    return False, ""
+    res = apply_name_mutations([("add", date_str, user_name)]).get(date_str)
+    if res is None:
+        return False, ""
+    return True, res[1]
 
 def remove_cant_user(date_str: str, user_name: str) -> tuple[bool, str, str]:
     """
@@ -393,110 +762,198 @@ def remove_cant_user(date_str: str, user_name: str) -> tuple[bool, str, str]:
     If the list becomes empty -> set Raid? to ✔, else keep ✖.
     Returns (found, new_flag, joined_names). If not found: (False, "", "").
     """
-    for (c1, c2, c3) in MONTH_COLS:
-        rows, idx = _read_month_block((c1, c2, c3))
-        hit = idx.get(date_str)
-        if not hit:
-            continue
-        row_i, cur_flag = hit
-        target_row = START_ROW + row_i
-
-        raid_col = c3
-        names_col = _next_col(c3)
-
-        names_rng = f"{TAB}!{names_col}{target_row}"
-        current = _read_cell(names_rng)
-        items = [p.strip() for p in current.split(",") if p.strip()] if current else []
-        # remove case-insensitively
-        items = [x for x in items if x.lower() != user_name.lower()]
-        joined = ", ".join(items)
-
-        if items:
-            # still people who can't: keep ✖
-            _write_cell(f"{TAB}!{raid_col}{target_row}", "✖")
-        else:
-            # nobody left: flip to ✔
-            _write_cell(f"{TAB}!{raid_col}{target_row}", "✔")
-
-        _write_cell(names_rng, joined)
-        new_flag = "✖" if items else "✔"
-        return True, new_flag, joined
-    return False, "", ""
-
-# ================= Reminders on existing sheet (starting row 300) =================
-
-REM_START_ROW = 300         # header row (A300:E300)
-REM_MAX_ROWS  = 1000        # how many lines to scan below the header (A301..A1299)
+    res = apply_name_mutations([("remove", date_str, user_name)]).get(date_str)
+    if res is None:
+        return False, "", ""
+    return True, res[0], res[1]
+
+def in_window(date_str: str, today: datetime | None = None) -> bool:
+    """True if the date is part of the visible window from today on (pure computation, no API call)."""
+    try:
+        dt = datetime.strptime(date_str, "%d.%m.%Y")
+    except ValueError:
+        return False
+    today = today or datetime.today()
+    first = datetime(today.year, today.month, today.day)
+    m0 = today.month - 1 + NUM_BLOCKS
+    last = datetime(today.year + (m0 // 12), (m0 % 12) + 1, 1)  # first day after the window
+    return first <= dt < last
+
+# ================= Reminders on their own tab =================
+# One row per user on the 'Reminders' tab, kept contiguous from row 2 (compaction
+# closes the gaps). Rows are read in pages up to the first empty one and cached
+# with the revision stamp, so lookups and listings cost nothing until somebody
+# else writes.
+
+REM_TAB       = "Reminders"
+REM_HEADER    = ["UserID","UserTag","Enabled","Time","LastNotified","Timezone","Delivery"]
+REM_DATA_ROW  = 2           # first data row on the Reminders tab
+REM_PAGE_ROWS = int(os.getenv("REM_PAGE_ROWS", "200"))
+
+# Legacy block on the Schedule tab, only read by the migration
+REM_START_ROW = 300         # header row (A300:G300)
+
+_rem_lock  = threading.RLock()    # serializes reminder read-modify-writes in this process
+_rem_ready = False                # tab exists, header written, legacy block gone
+# cached (data rows, user id -> row index); index 0 is sheet row REM_DATA_ROW
+_rem_cache: tuple[list[list[str]], dict[str, int]] | None = None
 
 def _rem_a1(suffix: str) -> str:
-    """Build A1 ranges on the same Schedule tab for the reminders block."""
-    return f"{TAB}!{suffix}"
-
-def _ensure_reminders_header():
-    """Ensure header exists at A300:E300 on the Schedule sheet."""
-    hdr_rng = _rem_a1(f"A{REM_START_ROW}:F{REM_START_ROW}")
-    existing = _values.get(spreadsheetId=SPREADSHEET_ID, range=hdr_rng).execute().get("values", [])
-    hdr = ["UserID","UserTag","Enabled","Time","LastNotified","Timezone"]
+    return f"'{REM_TAB}'!{suffix}"
 
-    if not existing or existing[0] != hdr:
-        _values.update(
+def _ensure_reminders_tab():
+    """
+    Create the Reminders tab on first use, then migrate the old A300+ block for as
+    long as the header is missing or legacy rows are left (a failed migration is
+    retried by the next call instead of orphaning the rows).
+    """
+    global _rem_ready
+    if _rem_ready:
+        return
+    with _rem_lock:
+        if _rem_ready:
+            return
+        meta = _svc.spreadsheets().get(spreadsheetId=SPREADSHEET_ID).execute()
+        titles = {s["properties"]["title"] for s in meta.get("sheets", [])}
+        if REM_TAB not in titles:
+            _svc.spreadsheets().batchUpdate(
+                spreadsheetId=SPREADSHEET_ID,
+                body={"requests": [{"addSheet": {"properties": {"title": REM_TAB}}}]}
+            ).execute()
+            print(f"[reminders] created '{REM_TAB}' tab")
+        got = _values.batchGet(
+            spreadsheetId=SPREADSHEET_ID, ranges=[_rem_a1("A1:G1"), f"{TAB}!A{REM_START_ROW}:A"]
+        ).execute().get("valueRanges", [])
+        header = (got[0].get("values") or []) if got else []
+        legacy = (got[1].get("values") or []) if len(got) > 1 else []
+        if header[:1] != [REM_HEADER] or any(r and r[0].strip() for r in legacy):
+            migrated = migrate_reminders_from_schedule()
+            print(f"[reminders] migrated {migrated} rows from {TAB}!A{REM_START_ROW + 1}:G")
+        _rem_ready = True
+
+def _rem_read_all() -> list[list[str]]:
+    """
+    Every data row of the Reminders tab, page by page until an empty page. A page
+    comes back short when its trailing rows are blank (e.g. cleared by hand), which
+    says nothing about the pages after it; it is padded so row indices stay right.
+    """
+    rows: list[list[str]] = []
+    start = REM_DATA_ROW
+    while True:
+        page = _values.get(
             spreadsheetId=SPREADSHEET_ID,
-            range=hdr_rng,
-            valueInputOption="USER_ENTERED",
-            body={"values":[hdr]}
-        ).execute()
+            range=_rem_a1(f"A{start}:G{start + REM_PAGE_ROWS - 1}")
+        ).execute().get("values", []) or []
+        if not page:
+            while rows and not any(c.strip() for c in rows[-1]):
+                rows.pop()  # blank tail from padding
+            return rows
+        rows.extend((list(r) + [""] * 7)[:7] for r in page)
+        rows.extend([""] * 7 for _ in range(REM_PAGE_ROWS - len(page)))
+        start += REM_PAGE_ROWS
+
+def migrate_reminders_from_schedule() -> int:
+    """
+    Move every row of the legacy Schedule!A301:G block (no 1000-row cap) to the end
+    of the Reminders tab and clear it. Safe to repeat: users already on the tab
+    keep their row there.
+    """
+    ensure_fresh(force=True)
+    legacy = _values.get(
+        spreadsheetId=SPREADSHEET_ID, range=f"{TAB}!A{REM_START_ROW+1}:G"
+    ).execute().get("values", []) or []
+    existing = _rem_read_all()
+    seen = {r[0] for r in existing if r[0]}
+    rows = []
+    for r in legacy:
+        if r and r[0].strip().isdigit() and r[0].strip() not in seen:
+            seen.add(r[0].strip())
+            rows.append(([r[0].strip()] + list(r[1:]) + [""] * 7)[:7])
+    data = [(_rem_a1("A1:G1"), [REM_HEADER])]
+    if rows:
+        first = REM_DATA_ROW + len(existing)
+        data.append((_rem_a1(f"A{first}:G{first + len(rows) - 1}"), rows))
+    _write_ranges(data)
+    _values.clear(spreadsheetId=SPREADSHEET_ID, range=f"{TAB}!A{REM_START_ROW}:G", body={}).execute()
+    _rem_invalidate()
+    return len(rows)
+
+def _rem_invalidate():
+    # plain assignment, no lock: ensure_fresh calls this while holding _cache_lock
+    global _rem_cache
+    _rem_cache = None
+
+def _rem_load() -> tuple[list[list[str]], dict[str, int]]:
+    """All data rows, read page by page until a short page; cached per revision."""
+    global _rem_cache
+    _ensure_reminders_tab()
+    ensure_fresh()
+    with _rem_lock:
+        cached = _rem_cache
+        if cached is not None:
+            return cached
+        rows = _rem_read_all()
+        _rem_cache = (rows, {r[0]: i for i, r in enumerate(rows) if r[0]})
+        return _rem_cache
+
+def _rem_upsert(user_id: int, patch) -> list[str]:
+    """Load, patch(row) in place, write back one row and patch the cache. New users get defaults."""
+    uid = str(user_id)
+    with _rem_lock:
+        rows, row_of = _rem_load()
+        i = row_of.get(uid)
+        row = list(rows[i]) if i is not None else [uid, "", "N", "17:00", "", "", "channel"]
+        patch(row)
+        if i is None:
+            i = len(rows)
+        _write_ranges([(_rem_a1(f"A{REM_DATA_ROW + i}:G{REM_DATA_ROW + i}"), [row])])
+        if i == len(rows):
+            rows.append(row)
+        else:
+            rows[i] = row
+        row_of[uid] = i
+        return row
+
+def compact_reminders() -> int:
+    """Drop rows that carry nothing anymore (disabled, no timezone, channel delivery). Returns rows removed."""
+    with _rem_lock:
+        rows, _row_of = _rem_load()
+        keep = [r for r in rows if r[0] and (r[2].upper() == "Y" or r[5] or r[6].lower() == "dm")]
+        removed = len(rows) - len(keep)
+        if not removed:
+            return 0
+        data = []
+        if keep:
+            data.append((_rem_a1(f"A{REM_DATA_ROW}:G{REM_DATA_ROW + len(keep) - 1}"), keep))
+        data.append((_rem_a1(f"A{REM_DATA_ROW + len(keep)}:G{REM_DATA_ROW + len(rows) - 1}"), [[""] * 7] * removed))
+        _write_ranges(data)
+        _rem_invalidate()
+        return removed
 
 def set_timezone(user_id: int, tz_str: str):
     """
     Upsert the user's IANA timezone (e.g., 'Europe/Berlin') in column F.
     """
-    _ensure_reminders_header()
-    data_rng = _rem_a1(f"A{REM_START_ROW+1}:F{REM_START_ROW+REM_MAX_ROWS}")
-    rows = _values.get(spreadsheetId=SPREADSHEET_ID, range=data_rng).execute().get("values", []) or []
-    uid = str(user_id)
-
-    # find existing row
-    found_i = None
-    for i, r in enumerate(rows):
-        if r and len(r) >= 1 and r[0] == uid:
-            found_i = i
-            break
-
-    if found_i is None:
-        # append new row with defaults and tz set
-        append_rownum = REM_START_ROW + 1 + len(rows)
-        _values.update(
-            spreadsheetId=SPREADSHEET_ID,
-            range=_rem_a1(f"A{append_rownum}:F{append_rownum}"),
-            valueInputOption="USER_ENTERED",
-            body={"values":[[uid, "", "N", "17:00", "", tz_str]]}
-        ).execute()
-    else:
-        rownum = REM_START_ROW + 1 + found_i
-        # patch only column F
-        _values.update(
-            spreadsheetId=SPREADSHEET_ID,
-            range=_rem_a1(f"F{rownum}"),
-            valueInputOption="USER_ENTERED",
-            body={"values":[[tz_str]]}
-        ).execute()
+    def patch(row):
+        row[5] = tz_str
+    _rem_upsert(user_id, patch)
 
 def get_enabled_reminders() -> list[dict]:
     """
     Return enabled reminders (with timezone if present):
-      [{'user_id': int, 'time': 'HH:MM', 'last': 'YYYY-MM-DD', 'tz': 'Europe/Berlin'}]
+      [{'user_id': int, 'time': 'HH:MM', 'last': 'YYYY-MM-DD', 'tz': 'Europe/Berlin', 'dm': bool}]
     """
-    _ensure_reminders_header()
-    data_rng = _rem_a1(f"A{REM_START_ROW+1}:F{REM_START_ROW+REM_MAX_ROWS}")
-    rows = _values.get(spreadsheetId=SPREADSHEET_ID, range=data_rng).execute().get("values", []) or []
+    with _rem_lock:
+        rows = list(_rem_load()[0])
     out = []
     for r in rows:
-        if len(r) >= 4 and str(r[2]).upper() == "Y":
+        if r[0] and str(r[2]).upper() == "Y":
             out.append({
                 "user_id": int(r[0]),
                 "time": r[3],
-                "last": (r[4] if len(r) >= 5 else ""),
-                "tz":   (r[5] if len(r) >= 6 and r[5] else ""),
+                "last": r[4],
+                "tz":   r[5],
+                "dm":   r[6].lower() == "dm",
             })
     return out
 
@@ -510,101 +967,107 @@ def _clean_hhmm(hhmm: str) -> str:
         raise ValueError("HH:MM out of range")
     return f"{h:02d}:{m:02d}"
 
-def set_reminder(user_id: int, user_tag: str, enable: bool, time_hhmm: str = "17:00"):
+def set_reminder(user_id: int, user_tag: str, enable: bool, time_hhmm: str = "17:00", dm: bool | None = None):
     """
-    Create/update a user's reminder row in the Schedule sheet at A300+.
-    Columns: UserID | UserTag | Enabled(Y/N) | Time(HH:MM) | LastNotified(YYYY-MM-DD)
+    Create/update a user's reminder row on the Reminders tab.
+    Columns: UserID | UserTag | Enabled(Y/N) | Time(HH:MM) | LastNotified(YYYY-MM-DD) | Timezone | Delivery(channel/dm)
+    dm=None keeps the current delivery mode.
     """
-    _ensure_reminders_header()
     time_hhmm = _clean_hhmm(time_hhmm)
 
-    data_rng = _rem_a1(f"A{REM_START_ROW+1}:F{REM_START_ROW+REM_MAX_ROWS}")
-    resp = _values.get(spreadsheetId=SPREADSHEET_ID, range=data_rng).execute()
-    rows = resp.get("values", []) or []
-
-    uid = str(user_id)
-    found_i = None
-    for i, r in enumerate(rows):
-        if r and len(r) >= 1 and r[0] == uid:
-            found_i = i
-            break
-
-    enabled = "Y" if enable else "N"
-    last = rows[found_i][4] if (found_i is not None and len(rows[found_i]) >= 5) else ""
-
-    if found_i is None:
-        # append on the first empty row after existing rows
-        append_rownum = REM_START_ROW + 1 + len(rows)
-        _values.update(
-            spreadsheetId=SPREADSHEET_ID,
-            range=_rem_a1(f"A{append_rownum}:E{append_rownum}"),
-            valueInputOption="USER_ENTERED",
-            body={"values":[[uid, user_tag, enabled, time_hhmm, ""]]}
-        ).execute()
-    else:
-        # overwrite that specific row
-        rownum = REM_START_ROW + 1 + found_i
-        _values.update(
-            spreadsheetId=SPREADSHEET_ID,
-            range=_rem_a1(f"A{rownum}:E{rownum}"),
-            valueInputOption="USER_ENTERED",
-            body={"values":[[uid, user_tag, enabled, time_hhmm, last]]}
-        ).execute()
+    def patch(row):
+        row[1] = user_tag
+        row[2] = "Y" if enable else "N"
+        row[3] = time_hhmm
+        if dm is not None:
+            row[6] = "dm" if dm else "channel"
+    _rem_upsert(user_id, patch)
 
 def mark_notified(user_id: int, date_iso: str):
     """
-    Set LastNotified (column E) for the user in the A300+ block.
+    Set LastNotified (column E) for the user.
     """
-    _ensure_reminders_header()
-    data_rng = _rem_a1(f"A{REM_START_ROW+1}:E{REM_START_ROW+REM_MAX_ROWS}")
-    rows = _values.get(spreadsheetId=SPREADSHEET_ID, range=data_rng).execute().get("values", []) or []
-    uid = str(user_id)
-    for i, r in enumerate(rows):
-        if r and len(r) >= 1 and r[0] == uid:
-            rownum = REM_START_ROW + 1 + i
-            _values.update(
-                spreadsheetId=SPREADSHEET_ID,
-                range=_rem_a1(f"E{rownum}"),
-                valueInputOption="USER_ENTERED",
-                body={"values":[[date_iso]]}
-            ).execute()
-            break
-
-def is_today_raid_day() -> bool:
+    mark_notified_many([(user_id, date_iso)])
+
+def mark_notified_many(items: list[tuple[int, str]]):
+    """mark_notified for several (user_id, date_iso) pairs in one write."""
+    if not items:
+        return
+    with _rem_lock:
+        rows, row_of = _rem_load()
+        writes, hits = [], []
+        for uid, date_iso in items:
+            i = row_of.get(str(uid))
+            if i is not None:
+                writes.append((_rem_a1(f"E{REM_DATA_ROW + i}"), [[date_iso]]))
+                hits.append((i, date_iso))
+        if writes:
+            _write_ranges(writes)
+            for i, date_iso in hits:
+                rows[i][4] = date_iso
+
+def is_today_raid_day(today: date | None = None) -> bool:
     """
     True if today's date exists in any visible block with a ✔. (reuses your schedule columns)
+    Pass today explicitly where the answer is cached per call arguments.
     """
-    today_s = datetime.today().strftime("%d.%m.%Y")
-    for (c1, c2, c3) in MONTH_COLS:
-        rng = _rem_a1(f"{c1}{START_ROW}:{c3}{START_ROW+30}")
-        rows = _values.get(spreadsheetId=SPREADSHEET_ID, range=rng).execute().get("values", []) or []
+    today = today or datetime.today().date()
+    today_s = today.strftime("%d.%m.%Y")
+    for rows in _all_blocks():
         for r in rows:
             if len(r) >= 3 and r[1] and r[1].strip() == today_s and r[2].strip() == "✔":
-                return True
+                return not rules.names_on(today)  # a recurring rule cancels it
     return False
 
 def _meta_a1(a1: str) -> str:
     return f"{TAB}!{a1}"
 
 def get_next7_message_id() -> int | None:
-    """Liest die Dashboard-Message-ID aus A3:B3 (key='Next7MessageId')."""
+    """Liest die Dashboard-Message-ID aus A3:B3 (key='Next7MessageId'); cached per revision."""
+    global _next7_cache
+    ensure_fresh()
+    if _next7_cache is not None:
+        return _next7_cache
     rng = _meta_a1(f"A{META_KEY_ROW}:B{META_KEY_ROW}")
     vals = _values.get(spreadsheetId=SPREADSHEET_ID, range=rng).execute().get("values", [])
     if vals and vals[0] and len(vals[0]) >= 2 and vals[0][0] == "Next7MessageId":
         try:
-            return int(vals[0][1])
+            _next7_cache = int(vals[0][1])
+            return _next7_cache
         except Exception:
             return None
     return None
 
 def set_next7_message_id(message_id: int) -> None:
     """Schreibt die Dashboard-Message-ID nach A3:B3 (key='Next7MessageId')."""
+    global _next7_cache
     rng = _meta_a1(f"A{META_KEY_ROW}:B{META_KEY_ROW}")
+    _write_ranges([(rng, [["Next7MessageId", str(message_id)]])])
+    _next7_cache = message_id
+
+LEASE_RANGE = f"E{META_KEY_ROW}:H{META_KEY_ROW}"  # key='Leader' | owner | expires (unix seconds) | data dir id
+
+def read_lease() -> tuple[str, float, str] | None:
+    """Leader lease from E3:H3 (leader.SheetLease); always read fresh, never cached."""
+    vals = _values.get(spreadsheetId=SPREADSHEET_ID, range=_meta_a1(LEASE_RANGE)).execute().get("values", [])
+    if vals and len(vals[0]) >= 3 and vals[0][0] == "Leader":  # owner "" = released
+        try:
+            return vals[0][1], float(vals[0][2]), (vals[0][3] if len(vals[0]) >= 4 else "")
+        except ValueError:
+            return None
+    return None
+
+def write_lease(owner: str, expires: float, dir_id: str = "") -> None:
+    """
+    Lease renewals are not schedule edits: plain update, no revision stamp, so the
+    caches stay valid. Only with the stamp source; leader.make_backend refuses the
+    sheet lease otherwise.
+    """
     _values.update(
         spreadsheetId=SPREADSHEET_ID,
-        range=rng,
-        valueInputOption="USER_ENTERED",
-        body={"values": [["Next7MessageId", str(message_id)]]}
+        range=_meta_a1(LEASE_RANGE),
+        valueInputOption="RAW",
+        body={"values": [["Leader", owner, f"{expires:.3f}", dir_id]]}
     ).execute()
 
 # === ADD: Nächste n Raid-Tage aus dem sichtbaren Grid lesen ===
@@ -616,12 +1079,10 @@ def get_next_raid_days(n: int = 7) -> list[dict]:
     berlin = ZoneInfo("Europe/Berlin")
     today  = datetime.now(berlin).date()
     found: list[dict] = []
+    active = rules.active()
 
-    for (c1, c2, c3) in MONTH_COLS:
-        rows, _idx = _read_month_block((c1, c2, c3))
-        names_col  = _next_col(c3)
-
-        for i, row in enumerate(rows):
+    for rows in _all_blocks():
+        for row in rows:
             if len(row) < 3:
                 continue
             weekday_s, date_s, flag = row[0], row[1], row[2]
@@ -634,16 +1095,41 @@ def get_next_raid_days(n: int = 7) -> list[dict]:
             if str(flag).strip() != "✔":
                 continue
 
-            names_rng = f"{TAB}!{names_col}{START_ROW + i}"
-            vals = _values.get(spreadsheetId=SPREADSHEET_ID, range=names_rng).execute().get("values", [])
-            cell = vals[0][0] if vals and vals[0] else ""
+            cell = row[3] if len(row) >= 4 else ""
             names = [s.strip() for s in str(cell).replace(",", "\n").split("\n") if s.strip()]
+            flag, names = rules.overlay(dt, "✔", names, active)
+            if flag != "✔":
+                continue  # a recurring rule cancels it
 
             found.append({"date": date_s, "weekday": weekday_s, "names": names})
             if len(found) >= n:
                 return found
 
     return found
+
+def get_schedule() -> list[dict]:
+    """
+    Whole visible window from today on (Europe/Berlin), served from the block cache.
+    Items: {"date": "dd.mm.YYYY", "weekday": "Monday", "flag": "✔"/"✖", "names": [..]}
+    """
+    today = datetime.now(ZoneInfo("Europe/Berlin")).date()
+    out: list[dict] = []
+    active = rules.active()
+    for rows in _all_blocks():
+        for row in rows:
+            if len(row) < 3:
+                continue
+            try:
+                dt = datetime.strptime(row[1], "%d.%m.%Y").date()
+            except Exception:
+                continue
+            if dt < today:
+                continue
+            cell = row[3] if len(row) >= 4 else ""
+            names = [s.strip() for s in str(cell).replace(",", "\n").split("\n") if s.strip()]
+            flag, names = rules.overlay(dt, str(row[2]).strip(), names, active)
+            out.append({"date": row[1], "weekday": row[0], "flag": flag, "names": names})
+    return out
 # ==============================================================================
 
 
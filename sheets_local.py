@@ -0,0 +1,162 @@
+# sheets_local.py
+"""
+In-memory stand-in for the small part of the Sheets v4 API that sheets_client uses.
+Enabled with SHEETS_BACKEND=local, for load tests and offline runs.
+
+It also keeps a Drive-style `version` counter that increments on every write,
+and `external_edit()` simulates an officer editing the tab by hand.
+"""
+import re, threading, time
+import tracing
+
+_A1 = re.compile(r"^(?:'?(?P<tab>[^'!]+)'?!)?(?P<c1>[A-Z]+)(?P<r1>\d*)(?::(?P<c2>[A-Z]+)(?P<r2>\d*))?$")
+
+
+def _col_num(col: str) -> int:
+    n = 0
+    for ch in col:
+        n = n * 26 + (ord(ch) - ord('A') + 1)
+    return n
+
+def _parse(a1: str) -> tuple[str, int, int | None, int, int]:
+    """'Tab'!A6:D36 -> (tab, row1, row2|None, col1, col2); rows/cols are 1-based."""
+    m = _A1.match(a1.strip())
+    if not m:
+        raise ValueError(f"unsupported range: {a1}")
+    tab = m["tab"] or "Sheet1"
+    c1 = _col_num(m["c1"])
+    c2 = _col_num(m["c2"]) if m["c2"] else c1
+    r1 = int(m["r1"]) if m["r1"] else 1
+    if m["c2"] is None:
+        r2 = r1
+    else:
+        r2 = int(m["r2"]) if m["r2"] else None  # open-ended column range
+    return tab, r1, r2, c1, c2
+
+
+class _Req:
+    def __init__(self, svc: "LocalService", fn, op: str):
+        self._svc, self._fn, self._op = svc, fn, op
+
+    def execute(self, num_retries: int = 0):
+        with tracing.span(f"sheets.local {self._op}"):
+            if self._svc.latency_s:
+                time.sleep(self._svc.latency_s)
+            with self._svc.lock:
+                self._svc.calls += 1
+                return self._fn()
+
+
+class _Values:
+    def __init__(self, svc: "LocalService"):
+        self._svc = svc
+
+    def get(self, spreadsheetId, range, **_kw):
+        return _Req(self._svc, lambda: {"range": range, "values": self._svc._read(range)}, "values.get")
+
+    def batchGet(self, spreadsheetId, ranges, **_kw):
+        return _Req(self._svc, lambda: {"valueRanges": [{"range": r, "values": self._svc._read(r)} for r in ranges]}, "values.batchGet")
+
+    def update(self, spreadsheetId, range, body, valueInputOption=None, **_kw):
+        return _Req(self._svc, lambda: self._svc._write(range, body.get("values", [])), "values.update")
+
+    def batchUpdate(self, spreadsheetId, body, **_kw):
+        def run():
+            for d in body.get("data", []):
+                self._svc._write(d["range"], d.get("values", []))
+            return {"totalUpdatedCells": sum(len(r) for d in body.get("data", []) for r in d.get("values", []))}
+        return _Req(self._svc, run, "values.batchUpdate")
+
+    def append(self, spreadsheetId, range, body, **_kw):
+        def run():
+            tab, _r1, _r2, c1, c2 = _parse(range)
+            grid = self._svc.tabs.setdefault(tab, {})
+            last = max((r for (r, c), v in grid.items() if c1 <= c <= c2 and v != ""), default=0)
+            for i, row in enumerate(body.get("values", [])):
+                for j, v in enumerate(row):
+                    grid[(last + 1 + i, c1 + j)] = str(v)
+            self._svc.version += 1
+            return {"updates": {"updatedRows": len(body.get("values", []))}}
+        return _Req(self._svc, run, "values.append")
+
+    def clear(self, spreadsheetId, range, body=None, **_kw):
+        def run():
+            tab, r1, r2, c1, c2 = _parse(range)
+            grid = self._svc.tabs.setdefault(tab, {})
+            for (r, c) in [k for k in grid if k[0] >= r1 and (r2 is None or k[0] <= r2) and c1 <= k[1] <= c2]:
+                del grid[(r, c)]
+            self._svc.version += 1
+            return {}
+        return _Req(self._svc, run, "values.clear")
+
+
+class _Spreadsheets:
+    def __init__(self, svc: "LocalService"):
+        self._svc = svc
+        self._values = _Values(svc)
+
+    def values(self):
+        return self._values
+
+    def get(self, spreadsheetId, **_kw):
+        return _Req(self._svc, lambda: {"sheets": [{"properties": {"title": t}} for t in self._svc.tabs]}, "get")
+
+    def batchUpdate(self, spreadsheetId, body, **_kw):
+        def run():
+            for req in body.get("requests", []):
+                if "addSheet" in req:
+                    self._svc.tabs.setdefault(req["addSheet"]["properties"]["title"], {})
+            self._svc.version += 1
+            return {}
+        return _Req(self._svc, run, "batchUpdate")
+
+
+class LocalService:
+    """Drop-in for build('sheets', 'v4', ...) backed by dicts of {(row, col): value}."""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.tabs: dict[str, dict[tuple[int, int], str]] = {"Schedule": {}}
+        self.lock = threading.RLock()
+        self.latency_s = latency_ms / 1000.0
+        self.version = 1  # Drive-style revision: bumps on every write
+        self.calls = 0
+        self._sheets = _Spreadsheets(self)
+
+    def spreadsheets(self):
+        return self._sheets
+
+    def drive_version(self) -> str:
+        return str(self.version)
+
+    def external_edit(self, a1: str, value: str):
+        """Simulate a hand edit in the browser (bypasses any revision stamp)."""
+        with self.lock:
+            self._write(a1, [[value]])
+
+    def _read(self, a1: str) -> list[list[str]]:
+        tab, r1, r2, c1, c2 = _parse(a1)
+        grid = self.tabs.get(tab, {})
+        if r2 is None:
+            r2 = max((r for (r, _c) in grid), default=r1 - 1)
+        rows = []
+        for r in range(r1, r2 + 1):
+            row = [grid.get((r, c), "") for c in range(c1, c2 + 1)]
+            while row and row[-1] == "":
+                row.pop()
+            rows.append(row)
+        while rows and not rows[-1]:
+            rows.pop()
+        return rows
+
+    def _write(self, a1: str, values: list[list]):
+        tab, r1, _r2, c1, _c2 = _parse(a1)
+        grid = self.tabs.setdefault(tab, {})
+        for i, row in enumerate(values):
+            for j, v in enumerate(row):
+                v = "" if v is None else str(v)
+                if v == "":
+                    grid.pop((r1 + i, c1 + j), None)
+                else:
+                    grid[(r1 + i, c1 + j)] = v
+        self.version += 1
+        return {"updatedRange": a1}
@@ -0,0 +1,182 @@
+# sheets_worker.py
+"""
+Optional out-of-process Sheets I/O (SHEETS_WORKER=1).
+
+All sheets_client work (HTTP, JSON decoding, credential refresh, retries) runs in
+a separate process, so it never competes with the discord.py gateway for the GIL.
+
+Protocol over one multiprocessing Connection (a socket pair):
+  request  (req_id, fn_name, args, kwargs)
+  response (req_id, ok, result | exception)
+Requests are pipelined: the worker runs them on its own thread pool and answers
+out of order, matched by req_id. A dead worker is restarted and every request
+that was in flight fails with ConnectionError; requests sent while it is down
+fail at once instead of waiting for their deadline.
+
+The worker is started as `python sheets_worker.py <fd> <threads>`, so this file
+is its entry module. multiprocessing's spawn would re-run the bot's __main__
+(Bot.py: discord client, tracing, profiler, tracemalloc) in the child first.
+POSIX only (the child inherits its end of the socket pair by fd).
+"""
+import asyncio, itertools, os, pickle, socket, subprocess, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Connection
+
+WORKER_THREADS  = 4
+RESTART_MAX_S   = 30  # backoff cap while the worker cannot be started
+
+
+def _worker_main(fd: int, threads: int):
+    import sheets_client as sheets
+
+    conn = Connection(fd)
+    send_lock = threading.Lock()  # pool threads answer concurrently
+
+    def reply(msg):
+        with send_lock:
+            conn.send(msg)
+
+    def run(req_id, name, args, kwargs):
+        try:
+            result = getattr(sheets, name)(*args, **kwargs)
+            if req_id:  # req_id 0 = fire-and-forget control message
+                reply((req_id, True, result))
+        except Exception as e:
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = RuntimeError(f"{type(e).__name__}: {e}")
+            reply((req_id, False, e))
+
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="sheets-worker")
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break  # the bot process went away
+        if msg is None:
+            break
+        pool.submit(run, *msg)
+    pool.shutdown(wait=True)
+
+
+class SheetsWorker:
+    def __init__(self, threads: int = WORKER_THREADS):
+        self._threads = threads
+        self._ids = itertools.count(1)
+        self._pending: dict[int, tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._token: tuple[str, str] | None = None  # last token pushed from the bot process
+        self.restarts = 0
+        self._spawn()
+        self._reader = threading.Thread(target=self._read_loop, name="sheets-worker-reader", daemon=True)
+        self._reader.start()
+
+    def _spawn(self):
+        """Start a fresh worker process (call with self._lock held)."""
+        ours, theirs = socket.socketpair()
+        try:
+            # a new interpreter, never a fork: this process already runs an event loop
+            self._proc = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), str(theirs.fileno()), str(self._threads)],
+                pass_fds=(theirs.fileno(),)
+            )
+        except BaseException:
+            ours.close()
+            raise
+        finally:
+            theirs.close()
+        self._conn = Connection(ours.detach())
+        if self._token:
+            self._conn.send((0, "adopt_token", self._token, {}))
+        print(f"[sheets_worker] started pid {self._proc.pid}")
+
+    def push_token(self, token: str, expiry_iso: str):
+        """Share a freshly minted token so the worker never refreshes on its own (thread-safe)."""
+        with self._lock:
+            self._token = (token, expiry_iso)
+            try:
+                self._conn.send((0, "adopt_token", self._token, {}))
+            except OSError:
+                pass  # worker is down; _spawn hands the token to its replacement
+
+    async def call(self, name: str, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        req_id = next(self._ids)
+        with self._lock:
+            try:
+                self._conn.send((req_id, name, args, kwargs))
+            except OSError as e:
+                raise ConnectionError(f"sheets worker unavailable: {e}") from e
+            self._pending[req_id] = (loop, fut)
+        try:
+            return await fut
+        finally:
+            with self._lock:
+                self._pending.pop(req_id, None)
+
+    @staticmethod
+    def _resolve(fut: asyncio.Future, ok: bool, payload):
+        if fut.done():
+            return
+        if ok:
+            fut.set_result(payload)
+        else:
+            fut.set_exception(payload)
+
+    def _read_loop(self):
+        while not self._closed:
+            try:
+                if not self._conn.poll(0.5):
+                    if not self._closed and self._proc.poll() is not None:
+                        self._restart()
+                    continue
+                req_id, ok, payload = self._conn.recv()
+            except (EOFError, OSError):
+                if not self._closed:
+                    self._restart()
+                continue
+            with self._lock:
+                hit = self._pending.get(req_id)
+            if hit:
+                loop, fut = hit
+                loop.call_soon_threadsafe(self._resolve, fut, ok, payload)
+
+    def _restart(self):
+        """Fail everything in flight, then bring up a new worker (reader thread only)."""
+        if self._proc.poll() is None:
+            self._proc.kill()  # lost the connection but still running: don't leave it behind
+        print(f"[sheets_worker] worker died (exit {self._proc.wait()}); restarting")
+        with self._lock:
+            self._conn.close()  # calls until the respawn fail fast with ConnectionError
+            lost = list(self._pending.values())
+            self._pending.clear()
+        for loop, fut in lost:
+            loop.call_soon_threadsafe(self._resolve, fut, False, ConnectionError("sheets worker crashed"))
+
+        delay = 1
+        while not self._closed:
+            try:
+                with self._lock:
+                    self._spawn()
+                    self.restarts += 1
+                return
+            except Exception as e:
+                print(f"[sheets_worker] restart failed: {type(e).__name__}: {e}; retrying in {delay}s")
+                time.sleep(delay)
+                delay = min(delay * 2, RESTART_MAX_S)
+
+    def close(self):
+        self._closed = True
+        try:
+            with self._lock:
+                self._conn.send(None)
+            self._proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self._proc.terminate()
+
+
+if __name__ == "__main__":
+    _worker_main(int(sys.argv[1]), int(sys.argv[2]))
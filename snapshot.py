@@ -0,0 +1,119 @@
+# snapshot.py
+"""
+Warm-start snapshot: the cached schedule blocks, reminder rows and Next7
+message id, written to data/ on shutdown and periodically, so a restarted bot
+can answer from memory right away while it revalidates against the sheet.
+
+Layout (little-endian, version 1):
+  header   magic "RAIDSNAP", u16 version, u16 flags (1 = has reminders),
+           f64 saved_at, u64 next7 id (0 = none), u32 payload length, u32 crc32
+  payload  str revision
+           u8 block count, per block: str c1, u16 row count, rows
+           [flags & 1] u32 reminder row count, rows
+  row      u8 cell count, cells as str;  str = u16 length + UTF-8
+The file is read through mmap; anything truncated, corrupt or from another
+version is ignored and the bot starts cold.
+"""
+import mmap, os, struct, tempfile, time, zlib
+
+DATA_DIR      = os.getenv("BOT_DATA_DIR", "data")
+SNAPSHOT_PATH = os.path.join(DATA_DIR, "warm_start.snap")
+
+MAGIC   = b"RAIDSNAP"
+VERSION = 1
+HAS_REMINDERS = 1
+
+_HEADER = struct.Struct("<8sHHdQII")
+_U8, _U16, _U32 = struct.Struct("<B"), struct.Struct("<H"), struct.Struct("<I")
+
+
+def _put_str(out: bytearray, s: str):
+    b = s.encode("utf-8")[:0xFFFF]
+    out += _U16.pack(len(b)) + b
+
+def _put_rows(out: bytearray, rows: list[list[str]], count: struct.Struct):
+    out += count.pack(len(rows))
+    for r in rows:
+        cells = r[:0xFF]
+        out += _U8.pack(len(cells))
+        for c in cells:
+            _put_str(out, "" if c is None else str(c))
+
+def save(state: dict, path: str = SNAPSHOT_PATH) -> int:
+    """Write sheets_client.export_state() atomically. Returns the file size."""
+    payload = bytearray()
+    _put_str(payload, state["rev"])
+    blocks = state["blocks"]
+    payload += _U8.pack(len(blocks))
+    for c1, rows in blocks.items():
+        _put_str(payload, c1)
+        _put_rows(payload, rows, _U16)
+    flags = 0
+    if state.get("reminders") is not None:
+        flags |= HAS_REMINDERS
+        _put_rows(payload, state["reminders"], _U32)
+
+    header = _HEADER.pack(MAGIC, VERSION, flags, time.time(), state.get("next7_id") or 0,
+                          len(payload), zlib.crc32(payload))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # unique temp name: instances sharing the data dir never write the same file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return len(header) + len(payload)
+
+
+class _Reader:
+    def __init__(self, buf, pos: int):
+        self.buf, self.pos = buf, pos
+
+    def num(self, st: struct.Struct) -> int:
+        (v,) = st.unpack_from(self.buf, self.pos)
+        self.pos += st.size
+        return v
+
+    def str(self) -> str:
+        n = self.num(_U16)
+        if self.pos + n > len(self.buf):
+            raise ValueError("truncated string")
+        s = self.buf[self.pos:self.pos + n].decode("utf-8")
+        self.pos += n
+        return s
+
+    def rows(self, count: struct.Struct) -> list[list[str]]:
+        return [[self.str() for _ in range(self.num(_U8))] for _ in range(self.num(count))]
+
+def load(path: str = SNAPSHOT_PATH) -> dict | None:
+    """The saved state (same shape as export_state, plus saved_at), or None if missing/unusable."""
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if len(mm) < _HEADER.size:
+                raise ValueError("short header")
+            magic, version, flags, saved_at, next7_id, length, crc = _HEADER.unpack_from(mm, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"unknown format {magic!r} v{version}")
+            end = _HEADER.size + length
+            if len(mm) < end or zlib.crc32(mm[_HEADER.size:end]) != crc:
+                raise ValueError("payload truncated or corrupt")
+            rd = _Reader(mm, _HEADER.size)
+            rev = rd.str()
+            blocks = {}
+            for _ in range(rd.num(_U8)):
+                c1 = rd.str()
+                blocks[c1] = rd.rows(_U16)
+            reminders = rd.rows(_U32) if flags & HAS_REMINDERS else None
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, struct.error, UnicodeDecodeError) as e:
+        print(f"[snapshot] ignoring {path}: {e}")
+        return None
+    return {"rev": rev, "blocks": blocks, "reminders": reminders,
+            "next7_id": next7_id or None, "saved_at": saved_at}
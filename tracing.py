@@ -0,0 +1,166 @@
+# tracing.py
+"""
+Lightweight spans: one root per interaction / tasks.loop iteration, with child
+spans for Sheets and Discord REST calls. The current span lives in a contextvar,
+so asyncio.to_thread() workers attach their spans to the right parent.
+
+Finished traces go to an in-memory ring buffer (see slowest()) and, if
+TRACE_FILE is set, to an OTLP/JSON file (one ExportTraceServiceRequest per line).
+"""
+import collections, contextvars, functools, json, os, threading, time
+
+TRACE_FILE   = os.getenv("TRACE_FILE", "")
+RING_SIZE    = int(os.getenv("TRACE_RING", "200"))
+SERVICE_NAME = "raid-bot"
+
+_current: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("trace_span", default=None)
+_ring: collections.deque = collections.deque(maxlen=RING_SIZE)
+_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attrs", "children", "error")
+
+    def __init__(self, name: str, parent: "Span | None", attrs: dict):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.parent_id = parent.span_id if parent else ""
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attrs = attrs
+        self.children: list[Span] = []
+        self.error = ""
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class span:
+    """
+    Context manager for a span. root=True starts a new trace even inside another
+    span (for fire-and-forget tasks) and records the trace it came from.
+    """
+
+    def __init__(self, name: str, root: bool = False, **attrs):
+        parent = _current.get()
+        if root and parent is not None:
+            attrs["follows_from"] = parent.trace_id
+            parent = None
+        self._parent = parent
+        self._span = Span(name, parent, attrs)
+        self._token = None
+
+    def __enter__(self) -> Span:
+        self._token = _current.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        sp = self._span
+        sp.end_ns = time.time_ns()
+        if exc_type is not None:
+            sp.error = f"{exc_type.__name__}: {exc}"
+        _current.reset(self._token)
+        if self._parent is None:
+            _finish(sp)
+        else:
+            with _lock:
+                self._parent.children.append(sp)
+        return False
+
+
+def traced(name: str):
+    """Decorator: run a coroutine function inside a root span (commands, loop bodies)."""
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(name, root=True):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def current() -> Span | None:
+    return _current.get()
+
+def _finish(root: Span):
+    with _lock:
+        _ring.append(root)
+    if TRACE_FILE:
+        try:
+            line = json.dumps(_otlp(root), ensure_ascii=False)
+            with _lock, open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except Exception as e:
+            print(f"[tracing] export failed: {e}")
+
+def _flatten(sp: Span) -> list[Span]:
+    out = [sp]
+    for ch in sp.children:
+        out.extend(_flatten(ch))
+    return out
+
+def _otlp_value(v) -> dict:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+def _otlp(root: Span) -> dict:
+    spans = []
+    for sp in _flatten(root):
+        spans.append({
+            "traceId": sp.trace_id,
+            "spanId": sp.span_id,
+            "parentSpanId": sp.parent_id,
+            "name": sp.name,
+            "kind": 1,
+            "startTimeUnixNano": str(sp.start_ns),
+            "endTimeUnixNano": str(sp.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in sp.attrs.items()],
+            "status": {"code": 2, "message": sp.error} if sp.error else {"code": 1},
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+    }]}
+
+def slowest(n: int = 5) -> list[Span]:
+    with _lock:
+        roots = list(_ring)
+    return sorted(roots, key=lambda s: s.duration_ms, reverse=True)[:n]
+
+def format_tree(sp: Span, depth: int = 0) -> list[str]:
+    extra = " ".join(f"{k}={v}" for k, v in sp.attrs.items() if k != "follows_from")
+    err = f"  !! {sp.error}" if sp.error else ""
+    lines = [f"{'  ' * depth}{sp.duration_ms:8.1f}ms  {sp.name}{('  ' + extra) if extra else ''}{err}"]
+    for ch in sorted(sp.children, key=lambda c: c.start_ns):
+        lines.extend(format_tree(ch, depth + 1))
+    return lines
+
+
+def instrument_discord(client):
+    """Child spans for every Discord REST call: bot HTTP client and interaction/webhook requests."""
+    from discord.webhook.async_ import AsyncWebhookAdapter
+
+    orig = client.http.request
+
+    async def http_request(route, *args, **kwargs):
+        with span(f"discord {route.method} {getattr(route, 'path', '')}"):
+            return await orig(route, *args, **kwargs)
+    client.http.request = http_request
+
+    if not getattr(AsyncWebhookAdapter.request, "_traced", False):
+        orig_wh = AsyncWebhookAdapter.request
+
+        async def webhook_request(self, route, *args, **kwargs):
+            with span(f"discord {route.method} {getattr(route, 'path', '')}"):
+                return await orig_wh(self, route, *args, **kwargs)
+        webhook_request._traced = True
+        AsyncWebhookAdapter.request = webhook_request